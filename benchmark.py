@@ -0,0 +1,186 @@
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+from pathlib import Path
+import cv2
+import numpy as np
+from corpus import load_corpus
+from detector import Frame, MatchResult, TemplateDetector, score_match
+from search_regions import SearchRegions
+from template_registry import TemplateRegistry
+
+# 不匯入 game_loop / image_handler / image_matcher (它們依賴 win32)，
+# 三個舊版 detect_image 以相同的比對參數重現；模板一律預先載入，不計入 imread 時間
+
+
+def matcher_match(registry, thresholds):
+    """image_matcher.detect_image 的比對方式：灰階、TM_CCOEFF_NORMED 與 TM_CCORR_NORMED 取最高分，
+    畫面不是 1080p 時先縮放模板"""
+    methods = [cv2.TM_CCOEFF_NORMED, cv2.TM_CCORR_NORMED]
+
+    def match(frame, key):
+        threshold = thresholds.get(key, 0.8)
+        template = registry.get(key).color
+        scale_ratio = frame.shape[0] / 1080
+        if abs(scale_ratio - 1.0) > 0.1:
+            template = cv2.resize(template, (int(template.shape[1] * scale_ratio),
+                                             int(template.shape[0] * scale_ratio)))
+        template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        if frame.gray.shape[0] < template_gray.shape[0] or frame.gray.shape[1] < template_gray.shape[1]:
+            return MatchResult(key, False, None, -1.0, threshold)
+        best_val, best_loc = max(score_match(frame.gray, template_gray, method) for method in methods)
+        found = best_val >= threshold
+        return MatchResult(key, found, best_loc if found else None, best_val, threshold,
+                           size=(template_gray.shape[1], template_gray.shape[0]))
+    return match
+
+
+def build_variants(config, registry):
+    """返回 {名稱: (逐一比對函數, 整張畫面檢測函數或 None, 關閉函數)}"""
+    thresholds = config['thresholds']
+    variants = {}
+
+    engine = TemplateDetector(registry, thresholds, regions=SearchRegions.from_config(config, persist=False),
+                              **TemplateDetector.options_from_config(config))
+    variants['engine'] = (engine.match, engine.detect_many, engine.close)
+
+    # game_loop.detect_image：彩色、三種方法取最高分
+    game_loop = TemplateDetector(registry, thresholds)
+    variants['game_loop'] = (game_loop.match, None, game_loop.close)
+
+    # image_handler.detect_image：彩色、只用 TM_CCOEFF_NORMED，不允許誤差
+    image_handler = TemplateDetector(registry, thresholds, methods=[cv2.TM_CCOEFF_NORMED], tolerance=0)
+    variants['image_handler'] = (image_handler.match, None, image_handler.close)
+
+    variants['image_matcher'] = (matcher_match(registry, thresholds), None, lambda: None)
+    return variants
+
+
+def percentiles(samples):
+    """返回毫秒為單位的 p50/p95/p99/平均值"""
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3),
+            'mean': round(float(values.mean()), 3), 'count': len(samples)}
+
+
+def accuracy(counts):
+    """由 tp/fp/fn 計算 precision 與 recall"""
+    tp, fp, fn = counts['tp'], counts['fp'], counts['fn']
+    return {**counts,
+            'precision': round(tp / (tp + fp), 4) if tp + fp else None,
+            'recall': round(tp / (tp + fn), 4) if tp + fn else None}
+
+
+def run_variant(match, detect_many, corpus, keys, repeat=1):
+    """在整個語料上執行一個變體，返回延遲與準確度統計"""
+    template_times = {key: [] for key in keys}
+    frame_times = []
+    counts = {key: {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0} for key in keys}
+
+    for _ in range(repeat):
+        for item in corpus:
+            frame = Frame(item.image)
+            if detect_many is not None:
+                # 正式流程：同一張截圖批次檢測所有模板
+                started = time.perf_counter()
+                results = detect_many(frame, keys)
+                frame_times.append(time.perf_counter() - started)
+                frame = Frame(item.image)
+            else:
+                results = {}
+
+            elapsed = 0.0
+            for key in keys:
+                started = time.perf_counter()
+                result = match(frame, key)
+                took = time.perf_counter() - started
+                template_times[key].append(took)
+                elapsed += took
+                results.setdefault(key, result)
+            if detect_many is None:
+                frame_times.append(elapsed)
+
+            for key in keys:
+                found = results[key].found
+                expected = key in item.labels
+                counts[key]['tp' if found and expected else 'fp' if found else 'fn' if expected else 'tn'] += 1
+
+    total = {name: sum(c[name] for c in counts.values()) for name in ('tp', 'fp', 'fn', 'tn')}
+    total_seconds = sum(frame_times)
+    return {
+        'frames': len(frame_times),
+        'fps': round(len(frame_times) / total_seconds, 2) if total_seconds else None,
+        'frame_latency_ms': percentiles(frame_times),
+        'templates': {key: {'latency_ms': percentiles(template_times[key]), **accuracy(counts[key])}
+                      for key in keys},
+        'overall': accuracy(total),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以標註截圖測量各檢測方式的延遲與準確度 (不需要遊戲視窗)")
+    parser.add_argument("corpus", help="包含 labels.json 的截圖目錄")
+    parser.add_argument("--config", default="config.json", help="配置文件路徑")
+    parser.add_argument("--variants", nargs="*", help="只執行指定的檢測方式 (engine, game_loop, image_handler, image_matcher)")
+    parser.add_argument("--keys", nargs="*", help="只測試指定的模板")
+    parser.add_argument("--repeat", type=int, default=1, help="重複執行整個語料的次數")
+    parser.add_argument("--output", help="結果 JSON 路徑，預設寫到 benchmarks/ 目錄")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    corpus = load_corpus(args.corpus)
+    registry = TemplateRegistry.from_config(config)
+    keys = [key for key in (args.keys or registry.keys()) if key in registry]
+    variants = build_variants(config, registry)
+    selected = args.variants or list(variants)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'config': args.config,
+        'corpus': str(args.corpus),
+        'corpus_frames': len(corpus),
+        'repeat': args.repeat,
+        'detection': config.get('detection', {}),
+        'variants': {},
+    }
+    for name in selected:
+        if name not in variants:
+            print(f"未知的檢測方式: {name}")
+            continue
+        match, detect_many, close = variants[name]
+        print(f"\n=== {name} ===")
+        try:
+            result = run_variant(match, detect_many, corpus, keys, args.repeat)
+        finally:
+            close()
+        report['variants'][name] = result
+
+        for key, r in result['templates'].items():
+            latency = r['latency_ms']
+            print(f"{key:22s} p50: {latency['p50']:8.2f}ms p95: {latency['p95']:8.2f}ms p99: {latency['p99']:8.2f}ms "
+                  f"precision: {r['precision'] if r['precision'] is not None else '-'} "
+                  f"recall: {r['recall'] if r['recall'] is not None else '-'}")
+        overall = result['overall']
+        print(f"每張截圖 p50: {result['frame_latency_ms']['p50']:.2f}ms FPS: {result['fps']} "
+              f"precision: {overall['precision']} recall: {overall['recall']}")
+
+    output = Path(args.output) if args.output else \
+        Path("benchmarks") / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"\n結果已寫入: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json
+import argparse
+from corpus import load_corpus
+from detector import METHOD_NAMES, score_match
+from template_registry import TemplateRegistry
+
+
+def calibrate_template(template, corpus, key):
+    """對每種匹配方法計算命中/未命中的分數間距，返回按間距排序的結果列表"""
+    results = []
+    for name, method in METHOD_NAMES.items():
+        hits, misses = [], []
+        for frame in corpus:
+            if frame.image.shape[0] < template.height or frame.image.shape[1] < template.width:
+                continue
+            score = score_match(frame.image, template.color, method)[0]
+            (hits if key in frame.labels else misses).append(score)
+        if not hits or not misses:
+            continue
+        min_hit, max_miss = min(hits), max(misses)
+        results.append({
+            "method": name,
+            "margin": min_hit - max_miss,
+            "min_hit": min_hit,
+            "max_miss": max_miss,
+            "threshold": (min_hit + max_miss) / 2
+        })
+    return sorted(results, key=lambda r: r["margin"], reverse=True)
+
+
+def calibrate(config, corpus, keys=None):
+    """為每個模板選出間距最大的方法與閾值，返回 {key: 結果}"""
+    registry = TemplateRegistry(config['image_paths'])
+    chosen = {}
+    for key in keys or registry.keys():
+        template = registry.get(key)
+        if template is None:
+            continue
+        results = calibrate_template(template, corpus, key)
+        if not results:
+            print(f"{key}: 樣本中缺少命中或未命中的截圖，略過")
+            continue
+        for r in results:
+            print(f"{key:22s} {r['method']:18s} 間距: {r['margin']:+.4f} "
+                  f"最低命中: {r['min_hit']:.4f} 最高未命中: {r['max_miss']:.4f}")
+        best = results[0]
+        if best["margin"] <= 0:
+            print(f"{key}: 沒有任何方法能區分命中與未命中，保留原設定")
+            continue
+        chosen[key] = best
+    return chosen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="根據標註截圖為每個模板選擇匹配方法與閾值")
+    parser.add_argument("corpus", help="包含 labels.json 的截圖目錄")
+    parser.add_argument("--config", default="config.json", help="配置文件路徑")
+    parser.add_argument("--keys", nargs="*", help="只校準指定的模板")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示結果，不寫回配置文件")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    corpus = load_corpus(args.corpus)
+    chosen = calibrate(config, corpus, args.keys)
+
+    print("\n=== 校準結果 ===")
+    for key, r in chosen.items():
+        print(f"{key:22s} {r['method']:18s} 閾值: {r['threshold']:.4f} 間距: {r['margin']:.4f}")
+
+    if args.dry_run or not chosen:
+        return
+
+    methods = config.setdefault('methods', {})
+    for key, r in chosen.items():
+        methods[key] = r['method']
+        config['thresholds'][key] = round(r['threshold'], 4)
+
+    with open(args.config, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4, ensure_ascii=False)
+    print(f"已寫回配置文件: {args.config}")
+
+
+if __name__ == "__main__":
+    main()
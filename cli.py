@@ -0,0 +1,182 @@
+import sys
+import time
+import json
+import builtins
+import argparse
+import importlib.util
+
+# 以這個模組載入的時間作為啟動時間的起點
+STARTED = time.perf_counter()
+
+# 這個檔案只匯入標準函式庫的輕量模組；cv2、numpy、win32、pyautogui 等
+# 只在需要它們的子命令中匯入，--import-report 會列出實際花費的時間
+
+
+class ImportTimer:
+    def __init__(self): #記錄各模組匯入時間，欄位與 python -X importtime 相同
+        self.records = []
+        self._stack = []
+        self._original = None
+
+    def install(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        try:
+            package = (globals or {}).get('__package__')
+            resolved = importlib.util.resolve_name('.' * level + name, package) if level else name
+        except (ImportError, ValueError):
+            resolved = name
+        if resolved in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.records.append((len(self._stack), resolved, elapsed - children, elapsed))
+
+    def report(self, minimum_ms=1.0, stream=None):
+        """輸出累計時間超過 minimum_ms 的模組 (子模組縮排在所屬模組之前，與 -X importtime 相同)"""
+        stream = stream or sys.stderr
+        print("import time: self [us] | cumulative | imported package", file=stream)
+        for depth, name, own, cumulative in self.records:
+            if cumulative * 1000 >= minimum_ms:
+                print(f"import time: {own * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}", file=stream)
+        total = sum(cumulative for depth, _, _, cumulative in self.records if depth == 0)
+        print(f"import time: 合計 {total * 1000:.1f} ms", file=stream)
+
+
+def startup_report(timer, label):
+    """印出匯入時間與從啟動到 label 的時間"""
+    if timer is not None:
+        timer.uninstall()
+        timer.report()
+    print(f"啟動到{label}: {(time.perf_counter() - STARTED) * 1000:.1f} ms", file=sys.stderr)
+
+
+def load_config(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_game(config, timer):
+    """單一視窗執行 GameLoop，回報到第一張截圖為止的啟動時間"""
+    import log_setup
+    from game_loop import GameLoop
+
+    log_setup.setup_logging("game_log")
+    try:
+        game = GameLoop(config)
+        game.on_first_frame = lambda: startup_report(timer, "第一張截圖")
+        game.start()
+        return game
+    finally:
+        log_setup.stop_logging()
+
+
+def command_run(args, timer):
+    if args.hwnd or args.fake:
+        import multi_instance
+        argv = ["--config", args.config]
+        argv += ["--hwnd", *map(str, args.hwnd)] if args.hwnd else []
+        argv += ["--fake", str(args.fake)] if args.fake else []
+        if timer is not None:
+            startup_report(timer, "開始執行")
+        multi_instance.main(argv)
+        return
+    run_game(load_config(args.config), timer)
+
+
+def command_replay(args, timer):
+    """以截圖目錄或影片重播執行整個流程，預設只記錄按鍵不送出"""
+    config = load_config(args.config)
+    config.setdefault('capture', {}).update(backend='replay', replay_path=args.path, loop=args.loop)
+    if not args.live_input:
+        config.setdefault('input', {})['backend'] = 'recording'
+    game = run_game(config, timer)
+    keys = getattr(game.input, 'keys', None)
+    if keys is not None:
+        print(f"重播期間記錄 {len(keys)} 個按鍵: {keys}")
+
+
+def command_bench(args, timer):
+    import benchmark
+    if timer is not None:
+        startup_report(timer, "開始測量")
+    benchmark.main(args.rest)
+
+
+def command_calibrate(args, timer):
+    import calibrate
+    if timer is not None:
+        startup_report(timer, "開始校準")
+    calibrate.main(args.rest)
+
+
+def command_bundle(args, timer):
+    import template_bundle
+    template_bundle.main(args.rest)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="NBA 2K 自動化工具")
+    parser.add_argument("--import-report", action="store_true", help="列出各模組匯入時間與啟動時間")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="執行自動化流程")
+    run.add_argument("--config", default="config.json", help="配置文件路徑")
+    run.add_argument("--hwnd", type=int, nargs="*", help="多視窗模式：指定視窗句柄")
+    run.add_argument("--fake", type=int, default=0, help="多視窗模式：使用指定數量的假視窗")
+    run.set_defaults(handler=command_run)
+
+    replay = commands.add_parser("replay", help="以重播的截圖執行流程 (不需要遊戲視窗)")
+    replay.add_argument("path", help="截圖目錄或影片檔")
+    replay.add_argument("--config", default="config.json", help="配置文件路徑")
+    replay.add_argument("--loop", action="store_true", help="播完後從頭開始")
+    replay.add_argument("--live-input", action="store_true", help="真的送出按鍵 (預設只記錄)")
+    replay.set_defaults(handler=command_replay)
+
+    # bench 與 calibrate 的參數原樣交給各自的 main()
+    bench = commands.add_parser("bench", help="測量檢測延遲與準確度 (參數同 benchmark.py)", add_help=False)
+    bench.set_defaults(handler=command_bench, passthrough=True)
+
+    calibrate = commands.add_parser("calibrate", help="校準匹配方法與閾值 (參數同 calibrate.py)", add_help=False)
+    calibrate.set_defaults(handler=command_calibrate, passthrough=True)
+
+    bundle = commands.add_parser("bundle", help="建立模板包 (參數同 template_bundle.py)", add_help=False)
+    bundle.set_defaults(handler=command_bundle, passthrough=True)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if rest and not getattr(args, 'passthrough', False):
+        parser.error(f"無法識別的參數: {' '.join(rest)}")
+    args.rest = rest
+    timer = None
+    if args.import_report:
+        timer = ImportTimer()
+        timer.install()
+    try:
+        args.handler(args, timer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if timer is not None:
+            timer.uninstall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import json
+import logging
+from pathlib import Path
+import cv2
+
+# 標註文件名稱：{"frame_0001.png": ["forward"], "frame_0002.png": []}
+LABELS_FILE = "labels.json"
+
+
+class CorpusFrame:
+    def __init__(self, name, image, labels): #已標註的截圖
+        self.name = name
+        self.image = image
+        self.labels = set(labels)
+
+
+def load_corpus(directory):
+    """讀取已標註的截圖目錄，返回 CorpusFrame 列表"""
+    logger = logging.getLogger(__name__)
+    directory = Path(directory)
+    labels_path = directory / LABELS_FILE
+    if not labels_path.exists():
+        raise FileNotFoundError(f"找不到標註文件: {labels_path}")
+
+    with open(labels_path, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+
+    frames = []
+    for name, keys in sorted(labels.items()):
+        image = cv2.imread(str(directory / name))
+        if image is None:
+            logger.warning(f"無法讀取截圖: {name}")
+            continue
+        if isinstance(keys, str):
+            keys = [keys]
+        frames.append(CorpusFrame(name, image, keys or []))
+    logger.info(f"已載入 {len(frames)} 張標註截圖")
+    return frames
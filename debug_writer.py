@@ -0,0 +1,154 @@
+import json
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import cv2
+
+DEBUG_SUFFIXES = {".png", ".json"}
+
+
+class DebugWriter:
+    def __init__(self, directory="debug", max_files=50, max_bytes=200 * 2**20, queue_size=8,
+                 crop_only=False, crop_padding=16): #背景寫入調試圖片
+        self.logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.crop_only = crop_only
+        self.crop_padding = crop_padding
+        self._queue = queue.Queue(maxsize=queue_size)
+        # 已寫入檔案的索引 [(路徑們, 位元組數)]，由舊到新，不需要每次重新列出目錄
+        self._index = deque()
+        self._bytes = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        # 多視窗模式下為 debug/<視窗> 子目錄，上層目錄可能還不存在
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+        self._thread = threading.Thread(target=self._run, name="debug-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立，未啟用時返回 None"""
+        debug = config.get('debug', {})
+        if not debug.get('enabled', True):
+            return None
+        return cls(directory=debug.get('directory', 'debug'),
+                   max_files=debug.get('max_files', 50),
+                   max_bytes=int(debug.get('max_mb', 200) * 2**20),
+                   queue_size=debug.get('queue_size', 8),
+                   crop_only=debug.get('crop_only', False),
+                   crop_padding=debug.get('crop_padding', 16))
+
+    def _load_index(self):
+        """啟動時掃描一次目錄，之後只維護記憶體中的索引"""
+        files = sorted((p for p in self.directory.iterdir() if p.suffix.lower() in DEBUG_SUFFIXES),
+                       key=lambda p: p.stat().st_mtime)
+        for path in files:
+            self._add([path], path.stat().st_size)
+        self._enforce_budget()
+
+    def submit(self, frame, result):
+        """把匹配結果排入寫入佇列；佇列已滿時直接丟棄，不阻塞檢測"""
+        if self._queue.full():
+            self.dropped += 1
+            return False
+        # 截圖緩衝區之後會被覆寫，這裡必須先複製 (只截取範圍時只複製小區塊)
+        x, y = result.loc
+        w, h = result.size
+        if self.crop_only:
+            frame_h, frame_w = frame.shape[:2]
+            left, top = max(0, x - self.crop_padding), max(0, y - self.crop_padding)
+            right = min(frame_w, x + w + self.crop_padding)
+            bottom = min(frame_h, y + h + self.crop_padding)
+            image = frame.image[top:bottom, left:right].copy()
+            origin = (left, top)
+        else:
+            image = frame.image.copy()
+            origin = (0, 0)
+        metadata = {
+            'key': result.key,
+            'score': round(float(result.score), 4),
+            'threshold': result.threshold,
+            'loc': [int(x), int(y)],
+            'size': [int(w), int(h)],
+            'region': list(result.region) if result.region is not None else None,
+            'frame_shape': list(frame.shape),
+            'origin': [int(origin[0]), int(origin[1])],
+            'timestamp': frame.timestamp,
+        }
+        try:
+            self._queue.put_nowait((image, metadata))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.failed += 1
+                self.logger.warning(f"保存調試圖片失敗: {e}")
+
+    def _write(self, image, metadata):
+        x, y = metadata['loc']
+        w, h = metadata['size']
+        left, top = metadata['origin']
+        top_left = (x - left, y - top)
+        bottom_right = (top_left[0] + w, top_left[1] + h)
+        cv2.rectangle(image, top_left, bottom_right, (0, 255, 0), 2)
+
+        timestamp = datetime.fromtimestamp(metadata['timestamp']).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        # 同一張截圖可能有多個匹配，加上序號避免檔名重複
+        name = f"{timestamp}_{self.written:06d}_{metadata['key']}_{'crop' if self.crop_only else 'match'}"
+        paths = [self.directory / f"{name}.png"]
+        if not cv2.imwrite(str(paths[0]), image):
+            raise IOError(f"無法寫入 {paths[0]}")
+        size = paths[0].stat().st_size
+        if self.crop_only:
+            paths.append(self.directory / f"{name}.json")
+            paths[1].write_text(json.dumps(metadata, ensure_ascii=False, indent=4), encoding='utf-8')
+            size += paths[1].stat().st_size
+        self.written += 1
+        self._add(paths, size)
+        self._enforce_budget()
+
+    def _add(self, paths, size):
+        self._index.append((paths, size))
+        self._bytes += size
+
+    def _enforce_budget(self):
+        """超過檔案數或容量上限時刪除最舊的檔案"""
+        while self._index and (len(self._index) > self.max_files or self._bytes > self.max_bytes):
+            paths, size = self._index.popleft()
+            self._bytes -= size
+            for path in paths:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    self.logger.warning(f"無法刪除舊調試圖片 {path}: {e}")
+
+    def stats(self):
+        """返回寫入、丟棄與失敗次數以及目前占用的容量"""
+        return {'written': self.written, 'dropped': self.dropped, 'failed': self.failed,
+                'files': len(self._index), 'bytes': self._bytes}
+
+    def close(self, timeout=2.0):
+        """寫完佇列中剩餘的圖片後結束背景執行緒"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
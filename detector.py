@@ -0,0 +1,450 @@
+import time
+import logging
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+from fft_matcher import FFTCorrelator
+
+# 預設的模板匹配方法
+MATCH_METHODS = [
+    cv2.TM_CCOEFF_NORMED,
+    cv2.TM_CCORR_NORMED,
+    cv2.TM_SQDIFF_NORMED
+]
+
+# config.json 中使用的方法名稱
+METHOD_NAMES = {
+    "TM_CCOEFF_NORMED": cv2.TM_CCOEFF_NORMED,
+    "TM_CCORR_NORMED": cv2.TM_CCORR_NORMED,
+    "TM_SQDIFF_NORMED": cv2.TM_SQDIFF_NORMED
+}
+
+
+def parse_methods(value):
+    """將方法名稱 (或名稱列表) 轉換為 OpenCV 常數列表"""
+    if isinstance(value, str):
+        value = [value]
+    return [METHOD_NAMES[name] for name in value]
+
+
+class Frame:
+    def __init__(self, image, timestamp=None, slot=None): #單次截圖快照
+        # slot 是 FrameRing 的緩衝區，image 是它的唯讀視圖，用完要 release()
+        self.slot = slot
+        self.image = slot.view() if slot is not None else image
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._gray = None
+        self._scaled = {}
+
+    @property
+    def gray(self):
+        """灰階版本，只在第一次使用時轉換 (有緩衝區時直接寫入預先配置的陣列)"""
+        if self._gray is None:
+            if self.slot is not None:
+                cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY, dst=self.slot.gray)
+                gray = self.slot.gray.view()
+                gray.flags.writeable = False
+                self._gray = gray
+            else:
+                self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def retain(self):
+        """增加緩衝區引用 (交給另一個使用者時)，返回自己"""
+        if self.slot is not None:
+            self.slot.ring.retain(self.slot)
+        return self
+
+    def release(self):
+        """用完畫面後歸還緩衝區，之後不可再讀取 image"""
+        if self.slot is not None:
+            self.slot.release()
+
+    def downscaled(self, factor, gray=False):
+        """縮小 factor 倍的畫面，同一張截圖只縮放一次"""
+        if (factor, gray) not in self._scaled:
+            if gray:
+                image = cv2.cvtColor(self.downscaled(factor), cv2.COLOR_BGR2GRAY)
+            else:
+                height, width = self.image.shape[:2]
+                image = cv2.resize(self.image, (width // factor, height // factor),
+                                   interpolation=cv2.INTER_AREA)
+            self._scaled[(factor, gray)] = image
+        return self._scaled[(factor, gray)]
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+
+class MatchResult:
+    def __init__(self, key, found, loc, score, threshold, size=None, region=None): #匹配結果
+        self.key = key
+        self.found = found
+        self.loc = loc
+        self.score = score
+        self.threshold = threshold
+        self.size = size
+        self.region = region
+        self.coarse_score = None
+        self.gray_score = None
+
+    def __iter__(self):
+        # 與舊的 (found, loc) 返回值相容
+        return iter((self.found, self.loc if self.found else None))
+
+    def __repr__(self):
+        coarse = f", coarse={self.coarse_score:.3f}" if self.coarse_score is not None else ""
+        return f"MatchResult({self.key!r}, found={self.found}, score={self.score:.3f}{coarse}, loc={self.loc})"
+
+
+def score_match(image, template, method):
+    """執行一次 matchTemplate，返回 (分數, 位置)，分數越高越好"""
+    result = cv2.matchTemplate(image, template, method)
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    if method == cv2.TM_SQDIFF_NORMED:
+        return 1 - min_val, min_loc
+    return max_val, max_loc
+
+
+def find_peaks(result, count, suppress):
+    """在 TM_*_NORMED 結果圖上找出前 count 個峰值 (分數, 位置)，相鄰 suppress 像素內只取一個"""
+    result = result.copy()
+    peaks = []
+    for _ in range(count):
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if not np.isfinite(max_val):
+            break
+        peaks.append((max_val, max_loc))
+        x, y = max_loc
+        result[max(0, y - suppress):y + suppress + 1, max(0, x - suppress):x + suppress + 1] = -np.inf
+    return peaks
+
+
+class TemplateDetector:
+    def __init__(self, registry, thresholds, methods=None, tolerance=0.001, default_threshold=0.8,
+                 regions=None, mode="direct", pyramid_factor=2, pyramid_candidates=3,
+                 pyramid_margin=4, pyramid_min_size=12, gray_first=False, gray_candidates=3,
+                 template_methods=None, fft=None, workers=0, metrics=None, pool=None, groups=None): #模板檢測器
+        self.logger = logging.getLogger(__name__)
+        self.metrics = metrics
+        self.registry = registry
+        self.thresholds = thresholds
+        self.regions = regions
+        self.methods = methods if methods is not None else MATCH_METHODS
+        self.template_methods = template_methods or {}
+        self.fft = fft
+        self.workers = workers
+        # 多個遊戲視窗共用同一個執行緒池時由建立者負責關閉
+        self._owns_pool = pool is None
+        if pool is None and workers > 1:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matcher")
+        self._pool = pool
+        self.tolerance = tolerance
+        self.default_threshold = default_threshold
+        self.mode = mode
+        self.pyramid_factor = pyramid_factor
+        self.pyramid_candidates = pyramid_candidates
+        self.pyramid_margin = pyramid_margin
+        self.pyramid_min_size = pyramid_min_size
+        self.gray_first = gray_first
+        self.gray_candidates = gray_candidates
+        # 模板組 {組名: [成員模板]}，detect_many 的 keys 可以直接使用組名
+        self.groups = groups or {}
+
+    @staticmethod
+    def options_from_config(config):
+        """從配置字典讀取檢測模式相關參數"""
+        detection = config.get('detection', {})
+        options = {}
+        if 'default_method' in detection:
+            options['methods'] = parse_methods(detection['default_method'])
+        if 'methods' in config:
+            options['template_methods'] = {key: parse_methods(name) for key, name in config['methods'].items()}
+        return {
+            **options,
+            'mode': detection.get('mode', 'direct'),
+            'pyramid_factor': detection.get('pyramid_factor', 2),
+            'pyramid_candidates': detection.get('pyramid_candidates', 3),
+            'pyramid_margin': detection.get('pyramid_margin', 4),
+            'pyramid_min_size': detection.get('pyramid_min_size', 12),
+            'gray_first': detection.get('gray_first', False),
+            'gray_candidates': detection.get('gray_candidates', 3),
+            'fft': FFTCorrelator.from_config(config),
+            'workers': detection.get('workers', 0),
+            'groups': config.get('template_groups', {}),
+        }
+
+    def match(self, frame, key, threshold=None, score_map=None, group=None):
+        """在一張截圖上比對單一模板，score_map 為預先以頻域批次算好的整張分數圖"""
+        if self.metrics is None:
+            return self._match(frame, key, threshold, score_map, group)
+        started = time.perf_counter()
+        result = self._match(frame, key, threshold, score_map, group)
+        self.metrics.observe("match", time.perf_counter() - started, key)
+        self.metrics.count_match(key, result.found)
+        return result
+
+    def _match(self, frame, key, threshold=None, score_map=None, group=None):
+        """group 為模板組共用的 (搜尋區域, 分數圖偏移)，此時 score_map 只涵蓋該區域"""
+        if threshold is None:
+            threshold = self.thresholds.get(key, self.default_threshold)
+        template = self.registry.get(key)
+        if template is None:
+            self.logger.error(f"找不到模板: {key}")
+            return MatchResult(key, False, None, -1.0, threshold)
+
+        frame_h, frame_w = frame.image.shape[:2]
+        if group is not None:
+            region, (offset_x, offset_y) = group
+        else:
+            region, offset_x, offset_y = None, 0, 0
+            if self.regions is not None:
+                region = self.regions.region_for(key, frame.image.shape)
+            if region is not None and (region[2] < template.width or region[3] < template.height):
+                region = None
+        if frame_h < template.height or frame_w < template.width:
+            return MatchResult(key, False, None, -1.0, threshold)
+
+        # 每個模板只使用為它設定的匹配方法
+        methods = self.template_methods.get(key, self.methods)
+        
+        # 候選位置一律使用整個畫面的座標
+        if score_map is not None and (region is None or group is not None):
+            candidates = [(val, (x + offset_x, y + offset_y), coarse_val) for val, (x, y), coarse_val
+                          in self._locate_score_map(score_map, template, self.gray_first)]
+        else:
+            candidates = self._locate(frame, template, region, self.gray_first, methods)
+        best_val, best_loc, coarse_score, gray_score = -1.0, None, None, None
+        for val, loc, coarse_val in candidates:
+            if self.gray_first:
+                # 只在候選位置的模板大小區域做彩色確認
+                gray_val = val
+                x, y = loc
+                patch = frame.image[y:y + template.height, x:x + template.width]
+                if patch.shape[0] < template.height or patch.shape[1] < template.width:
+                    continue
+                val = self._match_direct(patch, template.color, methods)[0]
+            if val > best_val:
+                best_val, best_loc, coarse_score = val, loc, coarse_val
+                gray_score = gray_val if self.gray_first else None
+
+        found = best_val >= (threshold - self.tolerance)
+        size = (template.width, template.height)
+        if self.regions is not None and group is None:
+            self.regions.record(key, found, best_loc, size, region)
+        result = MatchResult(key, found, best_loc, best_val, threshold, size, region)
+        result.coarse_score = coarse_score
+        result.gray_score = gray_score
+        return result
+
+    def _search_image(self, frame, region, gray, factor=1):
+        """返回 (搜尋用影像, 原解析度下的偏移)，影像為截圖的切片而非複本"""
+        if factor == 1:
+            image = frame.gray if gray else frame.image
+        else:
+            image = frame.downscaled(factor, gray)
+        if region is None:
+            return image, (0, 0)
+        x, y, w, h = region
+        left, top = x // factor, y // factor
+        return image[top:(y + h) // factor, left:(x + w) // factor], (left * factor, top * factor)
+
+    def _locate(self, frame, template, region, gray, methods):
+        """找出候選位置列表 [(分數, 位置, 粗略分數)]"""
+        template_image = template.gray if gray else template.color
+        if self.mode == "pyramid" and self._pyramid_applicable(template):
+            candidates = self._locate_pyramid(frame, template, region, gray, methods)
+            if candidates is not None:
+                return candidates
+
+        image, (offset_x, offset_y) = self._search_image(frame, region, gray)
+        if gray:
+            # 灰階階段保留多個峰值，讓顏色不同的相似模板可以在彩色確認時區分
+            result = cv2.matchTemplate(image, template_image, cv2.TM_CCOEFF_NORMED)
+            suppress = max(1, min(template.width, template.height) // 2)
+            peaks = find_peaks(result, self.gray_candidates, suppress)
+            return [(val, (x + offset_x, y + offset_y), None) for val, (x, y) in peaks]
+
+        val, loc = self._match_direct(image, template_image, methods)
+        if loc is None:
+            return []
+        return [(val, (loc[0] + offset_x, loc[1] + offset_y), None)]
+
+    def _locate_score_map(self, score_map, template, gray):
+        """從 TM_CCOEFF_NORMED 分數圖取出候選位置"""
+        if gray:
+            suppress = max(1, min(template.width, template.height) // 2)
+            return [(val, loc, None) for val, loc in find_peaks(score_map, self.gray_candidates, suppress)]
+        _, max_val, _, max_loc = cv2.minMaxLoc(score_map)
+        return [(max_val, max_loc, None)]
+
+    def _match_direct(self, image, template, methods):
+        """在整個搜尋範圍內以指定的方法匹配，返回最佳 (分數, 位置)"""
+        best_val = -1.0
+        best_loc = None
+        for method in methods:
+            val, loc = score_match(image, template, method)
+            if val > best_val:
+                best_val, best_loc = val, loc
+        return best_val, best_loc
+
+    def _pyramid_applicable(self, template):
+        return min(template.width, template.height) // self.pyramid_factor >= self.pyramid_min_size
+
+    def _locate_pyramid(self, frame, template, region, gray, methods):
+        """先在縮小的畫面上找候選位置，再在原解析度的鄰近區域確認；無法縮小時返回 None"""
+        factor = self.pyramid_factor
+        coarse_image, (offset_x, offset_y) = self._search_image(frame, region, gray, factor)
+        coarse_color, coarse_gray = template.scaled(1.0 / factor)
+        coarse_template = coarse_gray if gray else coarse_color
+        if (coarse_image.shape[0] < coarse_template.shape[0]
+                or coarse_image.shape[1] < coarse_template.shape[1]):
+            return None
+
+        coarse_result = cv2.matchTemplate(coarse_image, coarse_template, cv2.TM_CCOEFF_NORMED)
+        suppress = max(1, min(coarse_template.shape[:2]) // 2)
+        peaks = find_peaks(coarse_result, self.pyramid_candidates, suppress)
+
+        full_image = frame.gray if gray else frame.image
+        template_image = template.gray if gray else template.color
+        frame_h, frame_w = full_image.shape[:2]
+        margin = factor + self.pyramid_margin
+        candidates = []
+        for coarse_val, (cx, cy) in peaks:
+            # 在原解析度下只重新計算候選位置附近的小區域
+            left = max(0, cx * factor + offset_x - margin)
+            top = max(0, cy * factor + offset_y - margin)
+            right = min(frame_w, cx * factor + offset_x + template.width + margin)
+            bottom = min(frame_h, cy * factor + offset_y + template.height + margin)
+            patch = full_image[top:bottom, left:right]
+            if patch.shape[0] < template.height or patch.shape[1] < template.width:
+                continue
+            val, loc = self._match_direct(patch, template_image, methods)
+            candidates.append((val, (loc[0] + left, loc[1] + top), coarse_val))
+        return candidates
+
+    def _score_map_usable(self, key):
+        """TM_CCOEFF_NORMED 分數圖能否用於這個模板：灰階優先時分數圖只用來找候選位置，
+        彩色確認仍使用設定的方法；否則模板必須只使用 TM_CCOEFF_NORMED"""
+        return self.gray_first or self.template_methods.get(key, self.methods) == [cv2.TM_CCOEFF_NORMED]
+
+    def _batch_score_maps(self, frame, keys):
+        """對適合頻域計算的模板一次算出整張分數圖，返回 {key: 分數圖}"""
+        image = frame.gray if self.gray_first else frame.image
+        eligible = []
+        stats = {}
+        for key in keys:
+            template = self.registry.get(key)
+            if template is None or not self._score_map_usable(key):
+                continue
+            if self.regions is not None and self.regions.has_region(key):
+                continue
+            if self.mode == "pyramid" and self._pyramid_applicable(template):
+                continue
+            eligible.append((key, template.gray if self.gray_first else template.color))
+            stats[key] = template.stats(gray=self.gray_first)
+
+        # 快取放不下的模板每次都要重新變換頻譜，改以這個成本估算
+        capacity = self.fft.resident_count(image.shape)
+        batch = []
+        for key, template in eligible:
+            if self.fft.prefers_fft(image.shape, template.shape, len(eligible), cached=len(batch) < capacity):
+                batch.append((key, template))
+        if not batch:
+            return {}
+        return self.fft.correlate(image, batch, stats)
+
+    def _group_score_maps(self, image, members):
+        """模板組成員在同一個搜尋區域上的分數圖，適合頻域計算時整組一次批次計算
+        (畫面頻譜只算一次，相同尺寸的成員共用窗口能量)"""
+        eligible = [(key, template) for key, template in members if self._score_map_usable(key)]
+        if not eligible:
+            return {}
+        planes = [(key, template.gray if self.gray_first else template.color) for key, template in eligible]
+        cached = self.fft is not None and len(planes) <= self.fft.resident_count(image.shape)
+        if self.fft is not None and all(self.fft.prefers_fft(image.shape, plane.shape, len(planes), cached)
+                                        for _, plane in planes):
+            stats = {key: template.stats(gray=self.gray_first) for key, template in eligible}
+            return self.fft.correlate(image, planes, stats)
+        return {key: cv2.matchTemplate(image, plane, cv2.TM_CCOEFF_NORMED) for key, plane in planes}
+
+    def detect_group(self, frame, name, threshold=None, thresholds=None):
+        """在同一張截圖、同一個搜尋區域 (以組名設定或學習) 比對模板組的所有成員，
+        返回命中成員中超過閾值最多的結果，都沒有命中時返回分數最高的成員"""
+        thresholds = thresholds or {}
+        members = [(key, self.registry.get(key)) for key in self.groups[name] if self.registry.get(key) is not None]
+        frame_h, frame_w = frame.image.shape[:2]
+        members = [(key, template) for key, template in members
+                   if template.height <= frame_h and template.width <= frame_w]
+        if not members:
+            return MatchResult(name, False, None, -1.0, threshold if threshold is not None else self.default_threshold)
+
+        region = self.regions.region_for(name, frame.image.shape) if self.regions is not None else None
+        if region is not None and any(region[2] < template.width or region[3] < template.height
+                                      for _, template in members):
+            region = None
+        image, offset = self._search_image(frame, region, self.gray_first)
+        score_maps = self._group_score_maps(image, members)
+
+        results = [self.match(frame, key, threshold if threshold is not None else thresholds.get(key),
+                              score_maps.get(key), group=(region, offset))
+                   for key, _ in members]
+        best = max(results, key=lambda result: (result.found, result.score - result.threshold))
+        if self.regions is not None:
+            self.regions.record(name, best.found, best.loc, best.size, region)
+        return best
+
+    def detect(self, frame, key, threshold=None, thresholds=None, score_map=None):
+        """比對單一模板或模板組"""
+        if key in self.groups:
+            return self.detect_group(frame, key, threshold, thresholds)
+        return self.match(frame, key, threshold, score_map)
+
+    def detect_many(self, frame, keys, thresholds=None, stop_on=None):
+        """在同一張截圖上比對多個模板，按 keys 順序返回 {key: MatchResult}
+
+        stop_on 為 True 時任一模板命中、為 key 集合時其中一個命中，就不再比對排在後面的模板，
+        被略過的模板不會出現在結果中；keys 中的模板組名稱返回最佳成員的結果"""
+        thresholds = thresholds or {}
+        score_maps = {}
+        if self.fft is not None:
+            started = time.perf_counter()
+            score_maps = self._batch_score_maps(frame, keys)
+            if self.metrics is not None and score_maps:
+                self.metrics.observe("fft_batch", time.perf_counter() - started)
+
+        def should_stop(key, result):
+            return result.found and (stop_on is True or (stop_on and key in stop_on))
+
+        results = {}
+        if self._pool is None:
+            for key in keys:
+                results[key] = self.detect(frame, key, thresholds.get(key), thresholds, score_maps.get(key))
+                if should_stop(key, results[key]):
+                    break
+            return results
+
+        # 共用的衍生畫面先在主執行緒算好，避免多個執行緒重複計算
+        if self.gray_first:
+            frame.gray
+        futures = [(key, self._pool.submit(self.detect, frame, key, thresholds.get(key), thresholds,
+                                           score_maps.get(key)))
+                   for key in keys]
+        try:
+            for key, future in futures:
+                results[key] = future.result()
+                if should_stop(key, results[key]):
+                    break
+        finally:
+            # 較高優先的模板已命中 (或比對出錯) 時取消尚未開始的比對；已經開始的比對仍在讀取
+            # 這張截圖並記錄搜尋區域，要等它們結束才返回，呼叫端之後才能歸還 FrameRing 緩衝區
+            wait([future for _, future in futures if not future.cancel()])
+        return results
+
+    def close(self):
+        """關閉比對執行緒池 (共用的執行緒池不關閉)"""
+        if self._pool is not None:
+            if self._owns_pool:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
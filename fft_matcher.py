@@ -0,0 +1,159 @@
+import math
+import logging
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+class FFTCorrelator:
+    def __init__(self, mode="auto", batch_size=4, cache_bytes=256 * 1024 * 1024, cost_ratio=1.0): #頻域批次相關
+        self.logger = logging.getLogger(__name__)
+        self.mode = mode
+        self.batch_size = batch_size
+        self.cache_bytes = cache_bytes
+        self.cost_ratio = cost_ratio
+        # 比對執行緒與多個遊戲視窗共用同一個快取
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立，detection.fft 為 "never" 時返回 None"""
+        detection = config.get('detection', {})
+        mode = detection.get('fft', 'auto')
+        if mode == 'never':
+            return None
+        return cls(mode=mode,
+                   batch_size=detection.get('fft_batch_size', 4),
+                   cache_bytes=detection.get('fft_cache_mb', 256) * 1024 * 1024,
+                   cost_ratio=detection.get('fft_cost_ratio', 1.0))
+
+    @staticmethod
+    def fft_shape(image_shape):
+        """頻域運算使用的尺寸 (不小於畫面的最佳 DFT 尺寸)"""
+        return cv2.getOptimalDFTSize(image_shape[0]), cv2.getOptimalDFTSize(image_shape[1])
+
+    def spectrum_bytes(self, image_shape):
+        """一個模板在這個畫面尺寸下的快取頻譜大小"""
+        channels = image_shape[2] if len(image_shape) == 3 else 1
+        fh, fw = self.fft_shape(image_shape)
+        return fh * fw * channels * np.dtype(np.float32).itemsize
+
+    def resident_count(self, image_shape):
+        """快取最多能同時保留幾個這個畫面尺寸的模板頻譜
+        (每次掃描依序使用同一批模板，超過的部分在下次使用前就會被 LRU 淘汰)"""
+        return max(1, self.cache_bytes // self.spectrum_bytes(image_shape))
+
+    def prefers_fft(self, image_shape, template_shape, batch_count=1, cached=True):
+        """根據畫面與模板大小估算頻域是否比直接匹配便宜
+        cached 為 False 表示模板頻譜放不進快取，每次都要重新變換"""
+        if self.mode == 'always':
+            return True
+        height, width = image_shape[:2]
+        t_height, t_width = template_shape[:2]
+        channels = image_shape[2] if len(image_shape) == 3 else 1
+        fh, fw = self.fft_shape(image_shape)
+        size = fh * fw
+        # OpenCV 對較大的模板本身也走 DFT，每次都要重新變換整張畫面
+        spatial = (height - t_height + 1) * (width - t_width + 1) * t_height * t_width * channels
+        direct = min(spatial, size * math.log2(size) * (1 + channels))
+        # 每個模板一次反變換與逐點乘法，畫面的正變換由整批模板分攤
+        fft = size * math.log2(size) * (1 + channels / max(1, batch_count)) + size * channels
+        if not cached:
+            # 補零與各通道的正變換
+            fft += size * math.log2(size) * channels + size * channels
+        return fft * self.cost_ratio < direct
+
+    @staticmethod
+    def _spectrum(plane, fft_shape):
+        """補零至 fft_shape 後的頻譜 (OpenCV CCS 格式, float32)"""
+        padded = np.zeros(fft_shape, np.float32)
+        padded[:plane.shape[0], :plane.shape[1]] = plane
+        return cv2.dft(padded)
+
+    def _template_spectrum(self, key, template, fft_shape, stats=None):
+        """模板減去平均值後的補零頻譜 (依畫面尺寸快取)，stats 為預先算好的 (平均值, 平方和)"""
+        cache_key = (key, template.ndim, template.shape, fft_shape)
+        with self._lock:
+            entry = self._cache.get(cache_key)
+            if entry is not None:
+                self._cache.move_to_end(cache_key)
+                return entry
+
+        planes = template.astype(np.float32)
+        if planes.ndim == 2:
+            planes = planes[:, :, None]
+        if stats is not None:
+            mean, norm = stats
+            planes = planes - np.float32(mean)
+        else:
+            planes = planes - planes.reshape(-1, planes.shape[2]).mean(axis=0)
+            norm = float((planes.astype(np.float64) ** 2).sum())
+        spectrum = np.stack([self._spectrum(planes[:, :, c], fft_shape) for c in range(planes.shape[2])])
+        entry = (spectrum, norm)
+
+        with self._lock:
+            if cache_key not in self._cache:
+                self._cache[cache_key] = entry
+                self._cached_bytes += spectrum.nbytes
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, (old, _) = self._cache.popitem(last=False)
+                self._cached_bytes -= old.nbytes
+        return entry
+
+    @staticmethod
+    def _window_energy(planes, height, width):
+        """每個位置上模板大小窗口的 sum((I - mean)^2)，各通道相加"""
+        valid_h = planes.shape[0] - height + 1
+        valid_w = planes.shape[1] - width + 1
+        total = None
+        for c in range(planes.shape[2]):
+            # uint8 輸入在大窗口時 sqrBoxFilter 的整數累加會溢位，先轉成浮點數
+            plane = planes[:, :, c].astype(np.float32)
+            s1 = cv2.boxFilter(plane, cv2.CV_64F, (width, height), anchor=(0, 0),
+                               normalize=False, borderType=cv2.BORDER_CONSTANT)[:valid_h, :valid_w]
+            s2 = cv2.sqrBoxFilter(plane, cv2.CV_64F, (width, height), anchor=(0, 0),
+                                  normalize=False, borderType=cv2.BORDER_CONSTANT)[:valid_h, :valid_w]
+            energy = s2 - s1 * s1 / (height * width)
+            total = energy if total is None else total + energy
+        return np.maximum(total, 0).astype(np.float32)
+
+    def correlate(self, image, templates, stats=None):
+        """對同一張畫面批次計算 TM_CCOEFF_NORMED，templates 為 [(key, 模板)]，返回 {key: 分數圖}
+        stats 為 {key: (平均值, 平方和)}，有提供時不必重新計算"""
+        stats = stats or {}
+        planes = image if image.ndim == 3 else image[:, :, None]
+        height, width = planes.shape[:2]
+        channels = planes.shape[2]
+        fft_shape = self.fft_shape(image.shape)
+
+        # 畫面的頻譜與積分圖只計算一次
+        image_spectrum = [self._spectrum(planes[:, :, c], fft_shape) for c in range(channels)]
+
+        energies = {}
+        results = {}
+        for start in range(0, len(templates), self.batch_size):
+            batch = [(key, template) for key, template in templates[start:start + self.batch_size]
+                     if template.shape[0] <= height and template.shape[1] <= width]
+            if not batch:
+                continue
+            entries = [self._template_spectrum(key, template, fft_shape, stats.get(key)) for key, template in batch]
+
+            # 整批模板與畫面頻譜相乘，各通道在頻域相加後每個模板只做一次反變換
+            products = [sum(cv2.mulSpectrums(image_spectrum[c], spectrum[c], 0, conjB=True)
+                            for c in range(channels)) for spectrum, _ in entries]
+            correlation = [cv2.idft(product, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT) for product in products]
+
+            for (key, template), (_, norm), plane in zip(batch, entries, correlation):
+                t_height, t_width = template.shape[:2]
+                if (t_height, t_width) not in energies:
+                    energies[(t_height, t_width)] = self._window_energy(planes, t_height, t_width)
+                energy = energies[(t_height, t_width)]
+                numerator = plane[:height - t_height + 1, :width - t_width + 1]
+                denominator = cv2.sqrt(energy * np.float32(norm))
+                score = np.zeros_like(numerator)
+                np.divide(numerator, denominator, out=score, where=denominator > 1e-6 * max(norm, 1.0))
+                results[key] = np.clip(score, -1.0, 1.0, out=score)
+        return results
@@ -0,0 +1,96 @@
+import threading
+import logging
+import numpy as np
+
+
+class FrameSlot:
+    def __init__(self, ring, index, shape): #環形緩衝區中的一格
+        self.ring = ring
+        self.index = index
+        self.image = np.empty(shape, np.uint8)
+        self.gray = np.empty(shape[:2], np.uint8)
+        self.refs = 0
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes + self.gray.nbytes
+
+    def view(self):
+        """唯讀的彩色畫面視圖"""
+        view = self.image.view()
+        view.flags.writeable = False
+        return view
+
+    def release(self):
+        self.ring.release(self)
+
+
+class FrameRing:
+    def __init__(self, slots=4): #預先配置的截圖緩衝區
+        self.logger = logging.getLogger(__name__)
+        self.size = slots
+        self._lock = threading.Lock()
+        self._slots = []
+        self._shape = None
+        self.frames = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.copied_bytes = 0
+        self.overflows = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立，未啟用時返回 None"""
+        ring = config.get('frame_ring', {})
+        if not ring.get('enabled', False):
+            return None
+        return cls(ring.get('slots', 4))
+
+    def _allocate(self, index, shape):
+        slot = FrameSlot(self, index, shape)
+        self.allocations += 1
+        self.allocated_bytes += slot.nbytes
+        return slot
+
+    def acquire(self, shape):
+        """取得一格可寫入的緩衝區；畫面大小改變時重新配置，全部使用中時臨時配置一格"""
+        shape = tuple(shape)
+        with self._lock:
+            self.frames += 1
+            if shape != self._shape:
+                self.logger.info(f"配置截圖緩衝區: {self.size} x {shape}")
+                self._shape = shape
+                self._slots = [self._allocate(i, shape) for i in range(self.size)]
+            for slot in self._slots:
+                if slot.refs == 0:
+                    slot.refs = 1
+                    return slot
+            self.overflows += 1
+            slot = self._allocate(-1, shape)
+            slot.refs = 1
+            return slot
+
+    def retain(self, slot):
+        with self._lock:
+            slot.refs += 1
+
+    def release(self, slot):
+        """釋放一個引用，引用歸零後這格可以再被寫入"""
+        with self._lock:
+            slot.refs = max(0, slot.refs - 1)
+
+    def count_copy(self, nbytes):
+        """記錄寫入緩衝區的位元組數"""
+        self.copied_bytes += nbytes
+
+    def stats(self):
+        """返回配置次數與每張截圖平均複製的位元組數"""
+        frames = max(1, self.frames)
+        return {
+            'frames': self.frames,
+            'allocations': self.allocations,
+            'allocated_bytes': self.allocated_bytes,
+            'overflows': self.overflows,
+            'copied_bytes': self.copied_bytes,
+            'copied_bytes_per_frame': self.copied_bytes / frames,
+        }
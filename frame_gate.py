@@ -0,0 +1,60 @@
+import logging
+import cv2
+
+
+class FrameChangeGate:
+    def __init__(self, size=(96, 54), threshold=6.0, max_age=5.0): #畫面變化閘門
+        self.logger = logging.getLogger(__name__)
+        self.size = tuple(size)
+        self.threshold = threshold
+        self.max_age = max_age
+        self._cache = {}
+        self.last_thumbnail = None
+        self.checked = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立，未啟用時返回 None"""
+        gate = config.get('change_gate', {})
+        if not gate.get('enabled', False):
+            return None
+        return cls(size=gate.get('size', [96, 54]),
+                   threshold=gate.get('threshold', 6.0),
+                   max_age=gate.get('max_age', 5.0))
+
+    def thumbnail(self, frame):
+        """縮小的灰階畫面，每個像素是原畫面一個區塊的平均值"""
+        small = cv2.resize(frame.image, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def difference(self, previous, current):
+        """兩張縮圖中變化最大的區塊差值"""
+        return float(cv2.absdiff(previous, current).max())
+
+    def run(self, frame, keys, detect):
+        """畫面與上次檢測同一組模板時相比沒有變化就沿用上次結果，否則呼叫 detect()
+        返回 (結果, 是否沿用)"""
+        self.checked += 1
+        thumb = self.last_thumbnail = self.thumbnail(frame)
+        cache_key = tuple(keys)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            previous, timestamp, results = cached
+            if (frame.timestamp - timestamp <= self.max_age and previous.shape == thumb.shape
+                    and self.difference(previous, thumb) <= self.threshold):
+                self.skipped += 1
+                return results, True
+
+        results = detect()
+        self._cache[cache_key] = (thumb, frame.timestamp, results)
+        return results, False
+
+    def reset(self):
+        """清除快取 (例如按鍵之後一定要重新檢測時)"""
+        self._cache.clear()
+
+    def stats(self):
+        """返回檢查次數、略過次數與略過比例"""
+        ratio = self.skipped / self.checked if self.checked else 0.0
+        return {'checked': self.checked, 'skipped': self.skipped, 'skip_ratio': ratio}
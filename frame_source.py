@@ -0,0 +1,307 @@
+import logging
+from pathlib import Path
+import cv2
+import numpy as np
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp"}
+
+
+class FrameSource:
+    """截圖來源介面：grab() 返回 BGR 影像或 None"""
+
+    # 不循環播放的重播來源播完後設為 True
+    finished = False
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def grab(self):
+        raise NotImplementedError
+
+    def grab_into(self, ring):
+        """截圖寫入 FrameRing 的一格緩衝區並返回該格，失敗返回 None
+        預設實作是 grab() 之後再複製一次，能直接寫入緩衝區的來源會覆寫這個方法"""
+        image = self.grab()
+        if image is None:
+            return None
+        slot = ring.acquire(image.shape)
+        np.copyto(slot.image, image)
+        ring.count_copy(image.nbytes)
+        return slot
+
+    def close(self):
+        """釋放持有的資源"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class WindowSource(FrameSource):
+    def __init__(self, get_hwnd): #以視窗句柄截圖的來源
+        super().__init__()
+        self.get_hwnd = get_hwnd
+        self._black_frames = 0
+
+    def window_rect(self):
+        """返回 (left, top, width, height)，視窗不存在時返回 None"""
+        import win32gui
+        hwnd = self.get_hwnd()
+        if not hwnd:
+            return None
+        left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+        if right <= left or bottom <= top:
+            return None
+        return left, top, right - left, bottom - top
+
+    def check_black(self, image):
+        """連續取得全黑畫面時提示更換截圖方式 (部分 DirectX 視窗無法用 DC 擷取)"""
+        if image is not None and not image.any():
+            self._black_frames += 1
+            if self._black_frames == 10:
+                self.logger.warning("連續取得全黑畫面，請嘗試其他 capture.backend")
+        else:
+            self._black_frames = 0
+        return image
+
+
+class PyAutoGuiSource(WindowSource):
+    """以 pyautogui 截取視窗區域 (原本的做法，每張截圖都重新建立擷取)"""
+
+    def grab(self):
+        import pyautogui
+        rect = self.window_rect()
+        if rect is None:
+            return None
+        screenshot = pyautogui.screenshot(region=rect)
+        return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+
+    def grab_into(self, ring):
+        import pyautogui
+        rect = self.window_rect()
+        if rect is None:
+            return None
+        screenshot = np.asarray(pyautogui.screenshot(region=rect))
+        slot = ring.acquire(screenshot.shape)
+        cv2.cvtColor(screenshot, cv2.COLOR_RGB2BGR, dst=slot.image)
+        ring.count_copy(screenshot.nbytes + slot.image.nbytes)
+        return slot
+
+
+class WindowDCSource(WindowSource):
+    def __init__(self, get_hwnd, print_window=True): #重複使用視窗 DC 的截圖來源，不需要前台焦點
+        super().__init__(get_hwnd)
+        self.print_window = print_window
+        self._hwnd = None
+        self._size = None
+        self._window_dc = None
+        self._dc = None
+        self._memory_dc = None
+        self._bitmap = None
+
+    def _prepare(self, hwnd, width, height):
+        """視窗或大小改變時才重新建立 DC 與點陣圖"""
+        import win32gui
+        import win32ui
+        if hwnd == self._hwnd and (width, height) == self._size:
+            return
+        self.close()
+        self._window_dc = win32gui.GetWindowDC(hwnd)
+        self._dc = win32ui.CreateDCFromHandle(self._window_dc)
+        self._memory_dc = self._dc.CreateCompatibleDC()
+        self._bitmap = win32ui.CreateBitmap()
+        self._bitmap.CreateCompatibleBitmap(self._dc, width, height)
+        self._memory_dc.SelectObject(self._bitmap)
+        self._hwnd = hwnd
+        self._size = (width, height)
+
+    def _capture(self):
+        """擷取視窗內容，返回 BGRA 陣列 (直接引用 GetBitmapBits 的位元組，不再複製)"""
+        import win32con
+        from ctypes import windll
+        hwnd = self.get_hwnd()
+        rect = self.window_rect()
+        if rect is None:
+            return None
+        _, _, width, height = rect
+        self._prepare(hwnd, width, height)
+
+        if self.print_window:
+            # PW_RENDERFULLCONTENT，可擷取被遮住或硬體加速的視窗內容
+            windll.user32.PrintWindow(hwnd, self._memory_dc.GetSafeHdc(), 2)
+        else:
+            self._memory_dc.BitBlt((0, 0), (width, height), self._dc, (0, 0), win32con.SRCCOPY)
+
+        buffer = self._bitmap.GetBitmapBits(True)
+        return np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 4)
+
+    def grab(self):
+        image = self._capture()
+        if image is None:
+            return None
+        return self.check_black(cv2.cvtColor(image, cv2.COLOR_BGRA2BGR))
+
+    def grab_into(self, ring):
+        image = self._capture()
+        if image is None:
+            return None
+        slot = ring.acquire((image.shape[0], image.shape[1], 3))
+        cv2.cvtColor(image, cv2.COLOR_BGRA2BGR, dst=slot.image)
+        ring.count_copy(image.nbytes + slot.image.nbytes)
+        self.check_black(slot.image)
+        return slot
+
+    def close(self):
+        import win32gui
+        if self._bitmap is not None:
+            win32gui.DeleteObject(self._bitmap.GetHandle())
+        if self._memory_dc is not None:
+            self._memory_dc.DeleteDC()
+        if self._dc is not None:
+            self._dc.DeleteDC()
+        if self._window_dc is not None:
+            win32gui.ReleaseDC(self._hwnd, self._window_dc)
+        self._hwnd = self._size = self._window_dc = self._dc = self._memory_dc = self._bitmap = None
+
+
+class MssSource(WindowSource):
+    def __init__(self, get_hwnd): #長期保持 mss 連線的螢幕區域截圖
+        super().__init__(get_hwnd)
+        import mss
+        self._session = mss.mss()
+
+    def _capture(self):
+        """返回 BGRA 陣列，直接引用 mss 的位元組"""
+        rect = self.window_rect()
+        if rect is None:
+            return None
+        left, top, width, height = rect
+        shot = self._session.grab({"left": left, "top": top, "width": width, "height": height})
+        return np.frombuffer(shot.bgra, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def grab(self):
+        image = self._capture()
+        if image is None:
+            return None
+        return self.check_black(cv2.cvtColor(image, cv2.COLOR_BGRA2BGR))
+
+    def grab_into(self, ring):
+        image = self._capture()
+        if image is None:
+            return None
+        slot = ring.acquire((image.shape[0], image.shape[1], 3))
+        cv2.cvtColor(image, cv2.COLOR_BGRA2BGR, dst=slot.image)
+        ring.count_copy(image.nbytes + slot.image.nbytes)
+        self.check_black(slot.image)
+        return slot
+
+    def close(self):
+        self._session.close()
+
+
+class ReplaySource(FrameSource):
+    def __init__(self, path, loop=True): #重播截圖目錄或影片檔
+        super().__init__()
+        self.path = Path(path)
+        self.loop = loop
+        self._video = None
+        self._files = []
+        self._index = 0
+        if self.path.is_dir():
+            self._files = sorted(p for p in self.path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+            if not self._files:
+                self.logger.error(f"目錄中沒有截圖: {self.path}")
+        else:
+            self._video = cv2.VideoCapture(str(self.path))
+            if not self._video.isOpened():
+                self.logger.error(f"無法開啟影片: {self.path}")
+
+    def grab(self):
+        if self._video is not None:
+            ok, image = self._video.read()
+            if not ok and self.loop:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, image = self._video.read()
+            self.finished = not ok
+            return image if ok else None
+
+        if not self._files:
+            return None
+        if self._index >= len(self._files):
+            if not self.loop:
+                self.finished = True
+                return None
+            self._index = 0
+        image = cv2.imread(str(self._files[self._index]))
+        self._index += 1
+        return image
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+
+
+class SyntheticSource(FrameSource):
+    def __init__(self, registry, scenes, size=(1920, 1080), noise=8, seed=0, loop=True): #合成畫面 (Linux 測試用)
+        super().__init__()
+        self.registry = registry
+        self.loop = loop
+        self._index = 0
+        width, height = size
+        rng = np.random.default_rng(seed)
+        gradient = np.linspace(40, 120, width, dtype=np.float32)[None, :, None]
+        background = gradient + rng.normal(0, noise, (height, width, 3)).astype(np.float32)
+        self.background = np.clip(background, 0, 255).astype(np.uint8)
+        self.scenes = [self.compose(scene) for scene in scenes] or [self.background]
+
+    def compose(self, scene):
+        """把 [{"key": 模板, "loc": [x, y]}] 貼到背景上"""
+        image = self.background.copy()
+        for item in scene:
+            template = self.registry.get(item["key"])
+            if template is None:
+                self.logger.warning(f"合成畫面找不到模板: {item['key']}")
+                continue
+            x, y = item["loc"]
+            h = min(template.height, image.shape[0] - y)
+            w = min(template.width, image.shape[1] - x)
+            image[y:y + h, x:x + w] = template.color[:h, :w]
+        return image
+
+    def grab(self):
+        if self._index >= len(self.scenes):
+            if not self.loop:
+                return None
+            self._index = 0
+        image = self.scenes[self._index]
+        self._index += 1
+        return image
+
+
+def create_frame_source(config, get_hwnd=None, registry=None):
+    """根據 config.json 的 capture 設定建立截圖來源"""
+    capture = config.get('capture', {})
+    backend = capture.get('backend', 'pyautogui')
+    if backend == 'window_dc':
+        return WindowDCSource(get_hwnd, print_window=capture.get('print_window', True))
+    if backend == 'mss':
+        # mss 是選用套件 (不在 requirements.txt 中)
+        try:
+            return MssSource(get_hwnd)
+        except ImportError:
+            logging.getLogger(__name__).warning("未安裝 mss (pip install mss)，capture.backend 改用 window_dc")
+            return WindowDCSource(get_hwnd, print_window=capture.get('print_window', True))
+    if backend == 'replay':
+        return ReplaySource(capture['replay_path'], loop=capture.get('loop', True))
+    if backend == 'synthetic':
+        synthetic = capture.get('synthetic', {})
+        return SyntheticSource(registry, synthetic.get('scenes', []),
+                               size=synthetic.get('size', [1920, 1080]),
+                               noise=synthetic.get('noise', 8),
+                               seed=synthetic.get('seed', 0),
+                               loop=capture.get('loop', True))
+    if backend != 'pyautogui':
+        logging.getLogger(__name__).warning(f"未知的截圖方式 {backend}，改用 pyautogui")
+    return PyAutoGuiSource(get_hwnd)
@@ -1,71 +1,75 @@
-import os
 import time
-import win32api
-import win32con
-import win32gui
-import cv2
-import numpy as np
-import pyautogui
+try:
+    import win32con
+    import win32gui
+except ImportError:  # 非 Windows 環境 (以 replay/synthetic 截圖與 recording 輸入測試流程)
+    win32con = win32gui = None
 import logging
-from datetime import datetime
 import traceback
 import json
-from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from template_registry import TemplateRegistry
+from detector import Frame, TemplateDetector
+from search_regions import SearchRegions
+from frame_gate import FrameChangeGate
+from pipeline import Pipeline
+from frame_source import PyAutoGuiSource, WindowSource, create_frame_source
+from frame_buffer import FrameRing
+from debug_writer import DebugWriter
+from metrics import Metrics
+from screen_states import ScreenStateGraph
+from scheduler import PollScheduler
+from scale_manager import ScaleManager
+from input_backend import VK_ESCAPE, VK_SPACE, create_input_backend
+import log_setup
 
 def setup_logging():   #日志設置
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    
-    # 限制日志文件数量
-    MAX_LOG_FILES = 5
-    log_files = sorted(log_dir.glob("game_log_*.log"), key=lambda x: x.stat().st_mtime, reverse=True)
-    
-    # 删除旧的日志文件
-    for old_log in log_files[MAX_LOG_FILES-1:]:
-        try:
-            old_log.unlink()
-        except Exception as e:
-            print(f"无法删除旧日志文件 {old_log}: {e}")
-    
-    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = log_dir / f"game_log_{current_time}.log"
-    
-    log_format = '%(asctime)s [%(levelname)s] %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S'
-    
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)  # 将日志级别改为INFO
-    
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-    
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)  # 将文件处理器的级别改为INFO
-    file_handler.setFormatter(logging.Formatter(log_format, date_format))
-    root_logger.addHandler(file_handler)
-    
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)  # 将控制台处理器的级别改为INFO
-    console_handler.setFormatter(logging.Formatter('%(message)s'))
-    root_logger.addHandler(console_handler)
-    
+    # 檔案與主控台輸出在背景執行緒，重複呼叫不會重複加入 handler
+    log_file = log_setup.setup_logging("game_log")
     logging.info("遊戲啟動")
     return log_file
 
+class InstanceLogger(logging.LoggerAdapter):
+    """多視窗模式下在訊息前加上視窗名稱，限流的訊息也分開計算"""
+
+    def process(self, msg, kwargs):
+        extra = kwargs.get('extra')
+        if extra and 'throttle' in extra:
+            kwargs['extra'] = {**extra, 'throttle': f"{self.extra['instance']}:{extra['throttle']}"}
+        return f"[{self.extra['instance']}] {msg}", kwargs
+
 class GameWindow:   #遊戲視窗
-    def __init__(self, window_name="NBA 2K25"):
+    def __init__(self, window_name="NBA 2K25", frame_source=None, hwnd=None):
         self.window_name = window_name
-        self.hwnd = None
+        # 指定句柄時固定操作這個視窗 (多視窗模式)，不再以標題查找
+        self.fixed = hwnd is not None
+        self.hwnd = hwnd
+        self.frame_source = frame_source or PyAutoGuiSource(lambda: self.hwnd)
         self.find_window()
 
+    def set_frame_source(self, frame_source):
+        """更換截圖來源並釋放舊的來源"""
+        if self.frame_source is not None:
+            self.frame_source.close()
+        self.frame_source = frame_source
+
     def find_window(self):
         """查找遊戲窗口"""
-        self.hwnd = win32gui.FindWindow(None, self.window_name)
+        if self.fixed:
+            return self.is_valid()
+        self.hwnd = win32gui.FindWindow(None, self.window_name) if win32gui is not None else None
         if not self.hwnd:
             logging.error("未找到遊戲視窗")
             return False
         return True
 
+    def is_valid(self):
+        """視窗句柄是否仍然有效"""
+        return bool(self.hwnd) and win32gui is not None and bool(win32gui.IsWindow(self.hwnd))
+
+    def is_minimized(self):
+        return bool(win32gui.GetWindowLong(self.hwnd, win32con.GWL_STYLE) & win32con.WS_MINIMIZE)
+
     def get_window_rect(self):
         """獲取遊戲窗口的位置和大小"""
         try:
@@ -75,19 +79,14 @@ class GameWindow:   #遊戲視窗
         except Exception as e:
             return None
 
-    def get_screenshot(self):
-        """獲取遊戲窗口的截圖"""
+    def get_screenshot(self, ring=None):
+        """獲取遊戲窗口的截圖，指定 ring 時寫入其中一格緩衝區並返回該格"""
         try:
-            rect = win32gui.GetWindowRect(self.hwnd)
-            left, top, right, bottom = rect
-            width = right - left
-            height = bottom - top
-            
-            screenshot = pyautogui.screenshot(region=(left, top, width, height))
-            screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-            return screenshot
-            
+            if ring is not None:
+                return self.frame_source.grab_into(ring)
+            return self.frame_source.grab()
         except Exception as e:
+            logging.debug(f"截圖失敗: {e}")
             return None
 
 class GameState:
@@ -119,36 +118,97 @@ class GameState:
         }
 
 class GameLoop:
-    def __init__(self): #遊戲循環
+    def __init__(self, config=None, game_window=None, frame_source=None, shared=None, name=None): #遊戲循環
+        """config 預設讀取 config.json；多視窗模式下由 multi_instance 傳入各視窗的 game_window、
+        共用的 shared (模板註冊表、比對執行緒池、排程) 與用來區分日誌的 name"""
         self.is_running = False
         self.window_name = "NBA 2K25"
+        self.name = name
+        self.shared = shared
         self.logger = logging.getLogger(__name__)
-        self.game_window = GameWindow(self.window_name)
+        if name is not None:
+            self.logger = InstanceLogger(self.logger, {'instance': name})
+        self.game_window = game_window or GameWindow(self.window_name)
+        self.frame_source = frame_source
         self.state = GameState()
+        self.pipeline = None
+        self.last_input_time = 0.0
+        self.input_baseline = None
+        self.window_size = None
+        self.on_first_frame = None
+        self.current_action = None
+        self.wait_stats = {'template': 0, 'changed': 0, 'timeout': 0}
         
         # 載入配置
-        self.load_config()
+        self.load_config(config)
         
         self.KEYS = {
-            "RIGHT": ord('D'), "LEFT": ord('A'), "SPACE": win32con.VK_SPACE,
-            "E": ord('E'), "S": ord('S'), "W": ord('W'), "ESC": win32con.VK_ESCAPE
+            "RIGHT": ord('D'), "LEFT": ord('A'), "SPACE": VK_SPACE,
+            "E": ord('E'), "S": ord('S'), "W": ord('W'), "ESC": VK_ESCAPE
+        }
+        
+        # 畫面操作，config.json 的 screen_states 以名稱引用
+        self.ACTIONS = {
+            "dismiss_new_content": self.dismiss_new_content,
+            "enter_domination": self.enter_domination,
+            "scroll_domination_home": self.scroll_domination_home,
+            "next_tab": self.next_tab,
+            "enter_myteam": self.enter_myteam,
+            "claim_daily_reward": self.claim_daily_reward,
         }
         
-        # 定義模板匹配方法
-        self.MATCH_METHODS = [
-            cv2.TM_CCOEFF_NORMED,
-            cv2.TM_CCORR_NORMED,
-            cv2.TM_SQDIFF_NORMED
-        ]
-
-    def load_config(self):
+        # 三星搜尋時比對的圖片，設定了 stars_family 模板組時整組一次比對
+        self.STAR_IMAGES = ["stars", "stars2", "stars3", "stars4"]
+        if "stars_family" in self.detector.groups:
+            self.STAR_IMAGES = ["stars_family"]
+        
+        # 未設定狀態圖時各圖片對應的操作，命中其中一個就不再比對優先度較低的模板
+        self.MAIN_IMAGE_ACTIONS = {
+            "new_content": "dismiss_new_content",
+            "domination_btn": "enter_domination",
+            "domination_home": "scroll_domination_home",
+            "mycareer": "next_tab",
+            "myteam": "enter_myteam",
+            "daily_reward": "claim_daily_reward",
+        }
+
+    def load_config(self, config=None):
         """載入配置文件"""
         try:
-            with open('config.json', 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            if config is None:
+                with open('config.json', 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            self.config = config
             self.paths = config['image_paths']
             self.thresholds = config['thresholds']
             self.priority_order = config['priority']
+            options = TemplateDetector.options_from_config(config)
+            if self.shared is not None:
+                # 模板、縮放模板組、頻譜快取與執行緒池由所有視窗共用
+                self.templates = self.shared.templates
+                self.metrics = self.shared.metrics_for(self.name)
+                options.update(fft=self.shared.fft, pool=self.shared.pool)
+                views = self.shared.at_scale
+            else:
+                self.templates = TemplateRegistry.from_config(config)
+                self.metrics = Metrics.from_config(config)
+                views = None
+            self.regions = SearchRegions.from_config(config)
+            self.scales = ScaleManager.from_config(config, self.templates, views)
+            self.detector = TemplateDetector(self.templates, self.thresholds, regions=self.regions,
+                                             metrics=self.metrics, **options)
+            self.change_gate = FrameChangeGate.from_config(config)
+            # 等待畫面轉換時比較縮圖，沒有啟用閘門時另外建立一個只用來計算縮圖
+            self.screen_watch = self.change_gate or FrameChangeGate()
+            self.wait_options = config.get('wait', {})
+            self.screen_states = ScreenStateGraph.from_config(config)
+            self.scheduler = PollScheduler.from_config(config)
+            self.input = create_input_backend(config, lambda: self.game_window.hwnd)
+            self.input_options = config.get('input', {})
+            self.frame_ring = FrameRing.from_config(config)
+            self.debug_writer = DebugWriter.from_config(config)
+            self.game_window.set_frame_source(
+                self.frame_source or create_frame_source(config, lambda: self.game_window.hwnd, self.templates))
             self.logger.info("成功載入配置文件")
         except Exception as e:
             self.logger.error(f"載入配置文件失敗: {str(e)}")
@@ -162,184 +222,357 @@ class GameLoop:
             return False
         return True
 
-    def press_and_release(self, key):
-        if not self.game_window.hwnd or not win32gui.IsWindow(self.game_window.hwnd):
-            if not self.find_game_window(): 
-                self.logger.error("找不到遊戲視窗")
+    def input_timing(self):
+        """目前操作的按住與間隔秒數，config.json input.actions 可為每個操作個別設定"""
+        timing = {'hold': self.input_options.get('hold', 0.1), 'gap': self.input_options.get('gap', 0.3)}
+        timing.update(self.input_options.get('actions', {}).get(self.current_action, {}))
+        return timing['hold'], timing['gap']
+
+    def press_keys(self, keys, gap=None):
+        """依序送出多個按鍵，按鍵之間間隔 gap 秒 (預設使用目前操作的設定)"""
+        if self.input.requires_window:
+            if not self.game_window.is_valid():
+                if not self.find_game_window(): 
+                    self.logger.error("找不到遊戲視窗")
+                    return
+                    
+            if self.game_window.is_minimized():
+                self.logger.warning("視窗最小化")
                 return
-                
-        if win32gui.GetWindowLong(self.game_window.hwnd, win32con.GWL_STYLE) & win32con.WS_MINIMIZE:
-            self.logger.warning("視窗最小化")
-            return
             
-        try:
-            win32gui.SetForegroundWindow(self.game_window.hwnd)
-            time.sleep(0.1)  # 縮短設置前景窗口等待時間
-            scan_code = win32api.MapVirtualKey(key, 0)
-            win32api.keybd_event(key, scan_code, 0, 0)  # 按下鍵
-            time.sleep(0.1)  # 縮短按住時間為0.1秒
-            win32api.keybd_event(key, scan_code, win32con.KEYEVENTF_KEYUP, 0)  # 釋放鍵
-        except Exception as e:
-            self.logger.error(f"按鍵操作出錯: {str(e)}")
+        hold, default_gap = self.input_timing()
+        # 按鍵前最後一次檢測的畫面，wait_for() 以它判斷畫面是否已經改變
+        self.input_baseline = self.screen_watch.last_thumbnail
+        with self.turn("input"), self.metrics.timer("input"):
+            try:
+                # 只有視窗失去焦點時才重新設定前台
+                self.input.press_sequence(keys, hold, default_gap if gap is None else gap)
+                self.last_input_time = time.time()
+                self.scheduler.on_input()
+            except Exception as e:
+                self.logger.error(f"按鍵操作出錯: {str(e)}")
 
-    def detect_image(self, image_name, threshold=None):
-        """檢測圖片"""
-        if not os.path.exists(image_name):
-            self.logger.error(f"圖片不存在: {image_name}")
-            return False, None
-            
+    def press_and_release(self, key):
+        self.press_keys([key])
+
+    def turn(self, kind):
+        """多視窗模式下依先來後到輪流使用比對執行緒池 (detect) 或鍵盤 (input)，單一視窗時不需要等待"""
+        if self.shared is None:
+            return nullcontext()
+        return self.shared.turn(kind, self.name)
+
+    @contextmanager
+    def acting(self, action):
+        """在 with 區塊內按鍵使用 action 的按住與間隔設定"""
+        previous, self.current_action = self.current_action, action
         try:
+            yield
+        finally:
+            self.current_action = previous
+
+    @property
+    def window_required(self):
+        """輸入或截圖需要真實的遊戲視窗時為 True (replay/synthetic 加 recording 時不需要)"""
+        return self.input.requires_window or isinstance(self.game_window.frame_source, WindowSource)
+
+    def sleep(self, seconds):
+        """固定等待，計入 sleep 階段的統計"""
+        with self.metrics.timer("sleep"):
+            time.sleep(seconds)
+
+    def poll_wait(self, phase):
+        """輪詢之間的等待，間隔由排程器依最近是否有操作與 CPU 預算決定"""
+        self.sleep(self.scheduler.next_interval(phase))
+
+    def wait_for(self, keys=None, timeout=1.0):
+        """按鍵後等待畫面轉換，以 wait.interval 的間隔輪詢截圖：
+        畫面已經改變且 keys 中任一模板出現時返回該模板名稱；
+        畫面改變後連續 wait.settle 次沒有再變化時返回 True；超過 timeout 秒返回 False"""
+        keys = [key for key in (keys or []) if key in self.templates or key in self.detector.groups]
+        interval = self.wait_options.get('interval', 0.05)
+        settle = self.wait_options.get('settle', 2)
+        threshold = self.screen_watch.threshold
+        # 沒有按鍵前的畫面時以第一張截圖為準，模板不必等畫面改變就可以返回
+        baseline, self.input_baseline = self.input_baseline, None
+        any_frame = baseline is None
+        changed = False
+        previous = None
+        stable = 0
+        outcome = False
+        deadline = time.time() + timeout
+        with self.metrics.timer("wait"):
+            while True:
+                frame = self.capture_frame()
+                # 流水線的最新畫面可能早於按鍵，這種畫面不能用來判斷
+                if frame is not None and frame.timestamp >= self.last_input_time:
+                    try:
+                        thumb = self.screen_watch.last_thumbnail = self.screen_watch.thumbnail(frame)
+                        if baseline is None or baseline.shape != thumb.shape:
+                            baseline = thumb
+                        changed = changed or self.screen_watch.difference(baseline, thumb) > threshold
+                        results = self.detect_many(frame, keys, stop_on=True) if keys and (changed or any_frame) else {}
+                    finally:
+                        frame.release()
+                    found = next((key for key, result in results.items() if result.found), None)
+                    if found is not None:
+                        outcome = found
+                        break
+                    if previous is not None and changed:
+                        stable = stable + 1 if self.screen_watch.difference(previous, thumb) <= threshold else 0
+                        if stable >= settle:
+                            outcome = True
+                            break
+                    previous = thumb
+                elif frame is not None:
+                    frame.release()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                time.sleep(min(interval, remaining))
+        self.wait_stats['template' if isinstance(outcome, str) else 'changed' if outcome else 'timeout'] += 1
+        return outcome
+
+    def grab_frame(self):
+        """直接從遊戲視窗截圖"""
+        if isinstance(self.game_window.frame_source, WindowSource):
             rect = self.game_window.get_window_rect()
             if not rect:
                 self.logger.error("無法獲取窗口區域")
-                return False, None
-                
-            screenshot = self.game_window.get_screenshot()
-            if screenshot is None:
-                self.logger.error("無法獲取截圖")
-                return False, None
-                
-            template = cv2.imread(image_name)
-            if template is None:
-                self.logger.error(f"無法讀取模板圖片: {image_name}")
-                return False, None
-            
-            debug_dir = Path("debug")
-            debug_dir.mkdir(exist_ok=True)
-            
-            # 限制调试图片数量
-            MAX_DEBUG_FILES = 50
-            debug_files = sorted(debug_dir.glob("*.png"), key=lambda x: x.stat().st_mtime, reverse=True)
-            
-            # 删除旧的调试图片
-            for old_file in debug_files[MAX_DEBUG_FILES-1:]:
-                try:
-                    old_file.unlink()
-                except Exception as e:
-                    self.logger.warning(f"無法刪除舊調試圖片 {old_file}: {e}")
-            
-            # 只在匹配分数较高时保存调试图片
-            best_val = -1
-            max_loc = None
-            
-            for method in self.MATCH_METHODS:
-                result = cv2.matchTemplate(screenshot, template, method)
-                min_val, max_val, min_loc, curr_max_loc = cv2.minMaxLoc(result)
-                curr_val = 1 - min_val if method == cv2.TM_SQDIFF_NORMED else max_val
-                
-                if curr_val > best_val:
-                    best_val = curr_val
-                    max_loc = curr_max_loc if method != cv2.TM_SQDIFF_NORMED else min_loc
+                return None
+            self.window_size = (rect[2] - rect[0], rect[3] - rect[1])
             
-            threshold = threshold if threshold is not None else self.thresholds.get(Path(image_name).stem, 0.8)
+        # 以開始截圖的時間為準，判斷畫面是否早於最後一次按鍵
+        timestamp = time.time()
+        with self.metrics.timer("capture"):
+            screenshot = self.game_window.get_screenshot(self.frame_ring)
+        if screenshot is None:
+            if self.game_window.frame_source.finished:
+                self.logger.info("重播截圖已播完，結束程序")
+                self.stop()
+                return None
+            self.logger.error("無法獲取截圖")
+            return None
+        if self.on_first_frame is not None:
+            # 啟動時間統計 (cli.py --import-report)
+            callback, self.on_first_frame = self.on_first_frame, None
+            callback()
+        if self.frame_ring is None:
+            return Frame(screenshot, timestamp)
+        if self.frame_ring.frames % 200 == 0:
+            self.log_frame_ring()
+        return Frame(None, timestamp, slot=screenshot)
+
+    def log_frame_ring(self):
+        """記錄截圖緩衝區的配置次數與每張截圖複製的資料量"""
+        stats = self.frame_ring.stats()
+        self.logger.info(f"截圖緩衝區: {stats['frames']} 張截圖, 配置 {stats['allocations']} 次 "
+                         f"({stats['allocated_bytes'] / 2**20:.1f} MB, 臨時 {stats['overflows']} 次), "
+                         f"每張複製 {stats['copied_bytes_per_frame'] / 2**20:.2f} MB")
+
+    def capture_frame(self):
+        """擷取一張截圖作為本次掃描的共用畫面，用完要呼叫 frame.release()"""
+        if self.pipeline is not None and self.pipeline.running:
+            # 流水線模式下直接使用擷取執行緒最新的畫面
+            frame = self.pipeline.latest_frame()
+            if frame is None:
+                self.logger.error("無法獲取截圖")
+            return frame
+        return self.grab_frame()
+
+    def detect_many(self, frame, keys, thresholds=None, stop_on=None):
+        """在同一張截圖上檢測多個模板，返回 {key: MatchResult}"""
+        try:
+            if self.scales is not None:
+                factor = self.scales.update(frame, keys, self.window_size)
+                if factor is not None:
+                    self.apply_scale(factor)
+            if self.change_gate is not None:
+                # 畫面沒有變化時沿用上一次的檢測結果
+                cache_key = (tuple(keys), tuple(sorted((thresholds or {}).items())),
+                             stop_on if stop_on in (None, True) else tuple(sorted(stop_on)))
+                results, reused = self.change_gate.run(
+                    frame, cache_key, lambda: self._detect(frame, keys, thresholds, stop_on))
+                if self.change_gate.checked % 200 == 0:
+                    stats = self.change_gate.stats()
+                    self.logger.info(f"畫面未變化略過 {stats['skipped']}/{stats['checked']} 次檢測 ({stats['skip_ratio']:.0%})")
+                if reused:
+                    return results
+            else:
+                self.screen_watch.last_thumbnail = self.screen_watch.thumbnail(frame)
+                results = self._detect(frame, keys, thresholds, stop_on)
+        except Exception as e:
+            self.logger.error(f"圖片匹配出錯: {str(e)}")
+            return {}
             
+        for result in results.values():
             # 只在匹配分数接近阈值时记录日志
-            if abs(best_val - threshold) < 0.1:
-                self.logger.info(f"檢測圖片 {Path(image_name).stem} - 分數: {best_val:.3f} - 閾值: {threshold:.3f}")
-            
-            if best_val >= (threshold - 0.001):
-                # 只在成功匹配时保存调试图片
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                h, w = template.shape[:2]
-                top_left = max_loc
-                bottom_right = (top_left[0] + w, top_left[1] + h)
-                match_img = screenshot.copy()
-                cv2.rectangle(match_img, top_left, bottom_right, (0, 255, 0), 2)
-                cv2.imwrite(str(debug_dir / f"{timestamp}_{Path(image_name).stem}_match.png"), match_img)
-                return True, max_loc
+            if abs(result.score - result.threshold) < 0.1:
+                coarse = f" - 粗略分數: {result.coarse_score:.3f}" if result.coarse_score is not None else ""
+                coarse += f" - 灰階分數: {result.gray_score:.3f}" if result.gray_score is not None else ""
+                self.logger.info(f"檢測圖片 {result.key} - 分數: {result.score:.3f}{coarse} - 閾值: {result.threshold:.3f}",
+                                 extra={'throttle': f"score:{result.key}"})
             
+            if result.found:
+                self.save_debug_image(frame, result)
+        return results
+
+    def _detect(self, frame, keys, thresholds, stop_on):
+        with self.turn("detect"):
+            return self.detector.detect_many(frame, keys, thresholds, stop_on)
+
+    def apply_scale(self, factor):
+        """介面縮放比例改變後改用對應的模板組，搜尋區域換算到新的座標"""
+        self.detector.registry = self.scales.registry
+        self.regions.rescale(factor)
+        if self.change_gate is not None:
+            self.change_gate.reset()
+        self.logger.info(f"使用縮放比例 {self.scales.active:g} 的模板")
+
+    def detect_image(self, image_key, threshold=None, frame=None):
+        """檢測圖片"""
+        if image_key not in self.templates:
+            self.logger.error(f"找不到模板: {image_key}")
             return False, None
+            
+        captured = frame is None
+        if captured:
+            frame = self.capture_frame()
+            if frame is None:
+                return False, None
                 
-        except Exception as e:
-            self.logger.error(f"圖片匹配出錯: {str(e)}")
+        thresholds = {image_key: threshold} if threshold is not None else None
+        try:
+            result = self.detect_many(frame, [image_key], thresholds).get(image_key)
+        finally:
+            if captured:
+                frame.release()
+        if result is None or not result.found:
             return False, None
+        return True, result.loc
+
+    def save_debug_image(self, frame, result):
+        """把匹配成功的調試圖片交給背景執行緒保存"""
+        if self.debug_writer is not None:
+            self.debug_writer.submit(frame, result)
 
     def handle_matched_image(self, image_name):#遊戲處理
-        image_name = Path(image_name).stem.lower()
+        image_name = image_name.lower()
+        if self.screen_states is not None:
+            action = self.screen_states.action_for(image_name)
+        else:
+            action = self.MAIN_IMAGE_ACTIONS.get(image_name)
+        handler = self.ACTIONS.get(action)
+        if handler is None:
+            return False
+        with self.acting(action):
+            handler()
+        if self.screen_states is not None:
+            self.screen_states.advance(image_name)
+        return True
+
+    def dismiss_new_content(self):
+        self.logger.info("檢測到全新內容")
+        self.press_and_release(self.KEYS["E"])
+        self.wait_for(timeout=0.5)
+        self.press_and_release(self.KEYS["E"])
+        self.wait_for(timeout=0.5)
+
+    def enter_domination(self):
+        self.logger.info("檢測到稱霸賽按鈕")
+        self.press_and_release(self.KEYS["SPACE"])
+        self.state.set(in_domination=True)
+        self.wait_for(["full_of_stars", "select"], timeout=0.5)
         
-        if image_name == "new_content":
-            self.logger.info("檢測到全新內容")
-            self.press_and_release(self.KEYS["E"])
-            time.sleep(0.5)
-            self.press_and_release(self.KEYS["E"])
-            time.sleep(0.5)
-            return True
-            
-        elif image_name == "domination_btn":
-            self.logger.info("檢測到稱霸賽按鈕")
-            self.press_and_release(self.KEYS["SPACE"])
-            self.state.set(in_domination=True)
-            time.sleep(0.5)
-            
-            # 先檢查是否有滿星
-            self.check_full_stars()
-            
-            # 檢查選擇按鈕
-            if self.detect_image(self.paths["select"], threshold=self.thresholds["select"])[0]:
-                self.logger.info("檢測到選擇按鈕")
-                self.press_and_release(self.KEYS["SPACE"])
-                time.sleep(0.5)
-                self.handle_three_stars_search()
-            return True
-                
-        elif image_name == "domination_home":
-            self.logger.info("檢測到稱霸賽主頁")
-            for i in range(5):
-                self.press_and_release(self.KEYS["S"])
-                time.sleep(0.5)
-            return True
-                
-        elif image_name == "mycareer":
-            self.logger.info("檢測到MyCAREER")
-            self.press_and_release(self.KEYS["RIGHT"])
-            time.sleep(0.5)
-            return True
-            
-        elif image_name == "myteam":
-            self.logger.info("檢測到MyTEAM")
-            self.press_and_release(self.KEYS["SPACE"])
-            self.state.set(in_myteam=True)
-            time.sleep(0.5)
-            return True
-            
-        elif image_name == "daily_reward":
-            self.logger.info("檢測到每日獎勵")
-            self.press_and_release(self.KEYS["SPACE"])
-            time.sleep(3)
+        # 先檢查是否有滿星
+        self.check_full_stars()
+        
+        # 檢查選擇按鈕
+        if self.detect_image("select", threshold=self.thresholds["select"])[0]:
+            self.logger.info("檢測到選擇按鈕")
             self.press_and_release(self.KEYS["SPACE"])
-            return True
-            
-        return False
+            self.wait_for(self.STAR_IMAGES, timeout=0.5)
+            self.handle_three_stars_search()
+
+    def scroll_domination_home(self):
+        self.logger.info("檢測到稱霸賽主頁")
+        self.press_key_sequence(self.KEYS["S"], 5)
+
+    def next_tab(self):
+        self.logger.info("檢測到MyCAREER")
+        self.press_and_release(self.KEYS["RIGHT"])
+        self.wait_for(["myteam"], timeout=0.5)
+
+    def enter_myteam(self):
+        self.logger.info("檢測到MyTEAM")
+        self.press_and_release(self.KEYS["SPACE"])
+        self.state.set(in_myteam=True)
+        self.wait_for(timeout=0.5)
+
+    def claim_daily_reward(self):
+        self.logger.info("檢測到每日獎勵")
+        self.press_and_release(self.KEYS["SPACE"])
+        # 獎勵動畫播放完 (畫面停止變化) 才能再按空格
+        self.wait_for(timeout=3)
+        self.press_and_release(self.KEYS["SPACE"])
+        # 關閉獎勵畫面後等畫面穩定，避免下一次掃描還看到獎勵而再按一次空格
+        self.wait_for(timeout=0.5)
 
     def handle_main_images(self):#主圖片處理
-        any_image_handled = False
-        
-        for image_name in self.priority_order:
-            if not image_name in self.paths:
-                continue
-                
-            detected, loc = self.detect_image(self.paths[image_name], threshold=self.thresholds[image_name])
-            
-            if detected:
-                result = self.handle_matched_image(image_name)
-                if result:
-                    any_image_handled = True
-                    if image_name in ["new_content", "daily_reward"]:
-                        return True
+        # 每次掃描只截圖一次，所有模板共用同一張畫面
+        frame = self.capture_frame()
+        if frame is None:
+            return False
+        try:
+            results = self.detect_main_images(frame)
+        finally:
+            frame.release()
+        return self.act_on_main_images(results)
+
+    def detect_main_images(self, frame):
+        """按優先順序檢測主要圖片，有狀態圖時只檢測目前畫面狀態可能出現的圖片"""
+        candidates = self.screen_states.candidates() if self.screen_states is not None else None
+        if candidates is not None:
+            keys = [image_name for image_name in candidates if image_name in self.templates]
+            stop_on = set(keys)
+        else:
+            keys = [image_name for image_name in self.priority_order if image_name in self.templates]
+            if self.screen_states is not None:
+                stop_on = {key for key in keys if self.screen_states.action_for(key) is not None}
+            else:
+                stop_on = set(self.MAIN_IMAGE_ACTIONS)
+        return self.detect_many(frame, keys, stop_on=stop_on)
+
+    def act_on_main_images(self, results):
+        """對檢測結果中優先度最高且有對應操作的圖片執行操作 (結果已按優先順序排列)"""
+        for image_name, result in results.items():
+            if result.found:
+                # 處理後畫面已改變，剩餘模板留待下一次掃描
+                if self.handle_matched_image(image_name):
+                    return True
                         
-        return any_image_handled
+        return False
 
-    def check_three_stars(self):#三星檢查
-        self.logger.info("檢查三星...")
+    def check_three_stars(self, frame=None):#三星檢查
+        self.logger.info("檢查三星...", extra={'throttle': "check_stars"})
+        
+        captured = frame is None
+        if captured:
+            frame = self.capture_frame()
+            if frame is None:
+                return False
         
         # 檢查所有三星圖片
-        star_images = ["stars", "stars2", "stars3", "stars4"]
+        star_images = [img_name for img_name in self.STAR_IMAGES if img_name in self.detector.groups
+                       or (img_name in self.templates and img_name in self.thresholds)]
+        try:
+            results = self.detect_many(frame, star_images, stop_on=True)
+        finally:
+            if captured:
+                frame.release()
         for img_name in star_images:
-            if img_name in self.paths and img_name in self.thresholds:
-                result = self.detect_image(self.paths[img_name], threshold=self.thresholds[img_name])
-                if result[0]:
-                    self.logger.info(f"找到三星！({img_name})")
-                    return True
+            if results.get(img_name) is not None and results[img_name].found:
+                self.logger.info(f"找到三星！({results[img_name].key})")
+                return True
             
         return False
 
@@ -347,7 +580,7 @@ class GameLoop:
         self.logger.info(f"按{times}次按鍵並檢查三星")
         for i in range(times):
             self.press_and_release(key)
-            time.sleep(0.5)
+            self.wait_for(self.STAR_IMAGES, timeout=0.5)
             if self.check_three_stars():
                 self.logger.info("按鍵檢查時找到三星")
                 return True
@@ -362,11 +595,12 @@ class GameLoop:
             return True
         return False
         
-    def press_key_sequence(self, key, times, pause=0.3):#多次按鍵
-        """按指定鍵多次"""
-        for _ in range(times):
-            self.press_and_release(key)
-            time.sleep(pause)
+    def press_key_sequence(self, key, times, pause=None):#多次按鍵
+        """按指定鍵多次，一次送出整個序列；pause 預設使用目前操作的間隔設定"""
+        if pause is None:
+            pause = self.input_timing()[1]
+        self.press_keys([key] * times, gap=pause)
+        self.wait_for(timeout=pause)
     
     def navigate_and_check(self, direction_key, description):#導航檢查
         """導航並檢查三星"""
@@ -390,7 +624,6 @@ class GameLoop:
         if self.press_key_and_check_stars(self.KEYS["S"], 5):
             self.logger.info("找到三星！準備開始遊戲")
             self.state.set(search_count=0)                
-            time.sleep(0.5)
             self.trigger_game_start()
             return True
             
@@ -424,40 +657,42 @@ class GameLoop:
             if search_count >= 2:
                 self.logger.info("已搜尋2次，準備切換下一個")
                 self.press_and_release(self.KEYS["ESC"])
-                time.sleep(0.5)
+                self.wait_for(timeout=0.5)
                 self.press_and_release(self.KEYS["RIGHT"])
-                time.sleep(0.5)
+                self.wait_for(timeout=0.5)
                 self.press_and_release(self.KEYS["SPACE"])
+                # 等下一個挑戰的畫面載入，不能以加速輪詢的間隔直接按下一個鍵
+                self.wait_for(timeout=0.5)
                 self.state.set(search_count=0)
                 self.logger.info("重置搜尋次數為0")
             
-            time.sleep(0.5)
+            self.poll_wait("search")
 
     def trigger_game_start(self):  # 進入遊戲流程
         self.logger.info("=== 開始進入遊戲流程 ===")
         self.logger.info("按空格確認")
         self.press_and_release(self.KEYS["SPACE"])
-        time.sleep(1)
+        self.wait_for(timeout=1)
         
         self.logger.info("按兩次S鍵選擇難度")
-        for i in range(2):
-            self.press_and_release(self.KEYS["S"])
-            time.sleep(0.5)        
+        with self.acting("game_start"):
+            self.press_key_sequence(self.KEYS["S"], 2)
         
         self.logger.info("按空格確認難度")
         self.press_and_release(self.KEYS["SPACE"])
-        time.sleep(0.5)
+        self.wait_for(timeout=0.5)
         
         self.logger.info("按空格開始遊戲")
         self.press_and_release(self.KEYS["SPACE"])
-        time.sleep(0.5)
+        self.wait_for(timeout=0.5)
 
         # 進入遊戲循環
         self.logger.info("=== 進入遊戲循環 ===")
         while self.is_running:
             if self.handle_game_buttons():
                 continue
-            time.sleep(0.5)
+            # 模擬比賽期間畫面長時間不變，間隔會逐漸拉長
+            self.poll_wait("game")
 
     def check_full_stars(self):#滿星檢查
         self.logger.info("檢查滿星...")
@@ -469,19 +704,19 @@ class GameLoop:
         
         # 只要連續未找到的次數不超過閾值，就繼續搜索
         while not_found_count < max_not_found:
-            result = self.detect_image(self.paths["full_of_stars"], threshold=self.thresholds["full_of_stars"])
+            result = self.detect_image("full_of_stars", threshold=self.thresholds["full_of_stars"])
             
             if result[0]:
                 self.logger.info(f"找到滿星！按D鍵切換")
                 self.press_and_release(self.KEYS["RIGHT"])
-                time.sleep(0.2)  # 給畫面更新時間
+                self.wait_for(timeout=0.2)  # 等畫面切換到下一張卡
                 found_any = True
                 not_found_count = 0  # 重置未找到計數
             else:
                 not_found_count += 1
                 if not_found_count < max_not_found:
                     self.logger.info(f"第{not_found_count}次未找到滿星，繼續搜索...")
-                    time.sleep(0.2)  # 短暫等待後再次檢測
+                    self.poll_wait("full_stars")  # 短暫等待後再次檢測
         
         if found_any:
             self.logger.info("完成所有滿星處理")
@@ -491,45 +726,58 @@ class GameLoop:
             return False
 
     def handle_game_buttons(self): # 進入遊戲循環
-        if self.detect_image(self.paths["forward"])[0]:
+        frame = self.capture_frame()
+        if frame is None:
+            return False
+            
+        # 檢測完就歸還緩衝區，後面的操作流程會再擷取新的畫面
+        try:
+            found = {key: result.found for key, result in
+                     self.detect_many(frame, ["forward", "pause", "continue", "99_over"], stop_on=True).items()}
+            three_stars = not any(found.values()) and self.check_three_stars(frame)
+        finally:
+            frame.release()
+        
+        if found.get("forward"):
             self.logger.info("找到前進按鈕，按下空白鍵")
             self.press_and_release(self.KEYS["SPACE"])
-            time.sleep(0.5)
+            self.wait_for(timeout=0.5)
             return True
-        elif self.detect_image(self.paths["pause"])[0]:
+        elif found.get("pause"):
             self.logger.info("找到暫停按鈕，按下空白鍵")
             self.press_and_release(self.KEYS["SPACE"])
-            time.sleep(0.5)
+            self.wait_for(timeout=0.5)
             return True
-        elif self.detect_image(self.paths["continue"])[0]:
+        elif found.get("continue"):
             self.logger.info("找到繼續按鈕，按下空白鍵")
             self.press_and_release(self.KEYS["SPACE"])
             self.state.set(in_domination=False)
-            time.sleep(0.5)
+            self.wait_for(timeout=0.5)
             return True
-        elif self.detect_image(self.paths["99_over"])[0]:
+        elif found.get("99_over"):
             self.logger.info("找到 99 Overall 圖標，按ESC退出，然後按D再按空格")
             self.press_and_release(self.KEYS["ESC"])
-            time.sleep(0.5)
+            self.wait_for(timeout=0.5)
             self.press_and_release(self.KEYS["RIGHT"])  # 按D鍵向右
-            time.sleep(0.5)
+            self.wait_for(timeout=0.5)
             self.press_and_release(self.KEYS["SPACE"])  # 按空格鍵確認
-            time.sleep(0.5)
+            self.wait_for(timeout=0.5)
             return True
-        elif self.check_three_stars():
+        elif three_stars:
             self.logger.info("找到三星按鈕，進入三星搜尋")
             self.handle_three_stars_search()
             return True
             
-        self.logger.info("尋找圖片...")
+        self.logger.info("尋找圖片...", extra={'throttle': "searching"})
         return False
 
     def start(self):#開始
-        if not self.find_game_window():
+        if self.window_required and not self.find_game_window():
             self.logger.error("找不到遊戲視窗，程式退出")
             return
         self.logger.info("開始執行自動化程序...")
         self.is_running = True
+        self.metrics.start()
         try:
             self.main_loop()
         except KeyboardInterrupt:
@@ -538,20 +786,76 @@ class GameLoop:
         except Exception as e:
             self.logger.error(f"發生錯誤: {str(e)}")
             self.is_running = False
+        finally:
+            self.detector.close()
+            self.game_window.frame_source.close()
+            if self.change_gate is not None:
+                stats = self.change_gate.stats()
+                self.logger.info(f"畫面未變化共略過 {stats['skipped']}/{stats['checked']} 次檢測")
+            if self.frame_ring is not None:
+                self.log_frame_ring()
+            if self.debug_writer is not None:
+                self.debug_writer.close()
+                self.logger.info(f"調試圖片: {self.debug_writer.stats()}")
+            self.metrics.stop()
+            if self.screen_states is not None:
+                self.logger.info(f"畫面狀態統計: {self.screen_states.stats()}")
+            self.logger.info(f"輪詢排程統計: {self.scheduler.stats()}")
+            if self.scales is not None:
+                self.logger.info(f"縮放比例統計: {self.scales.stats()}")
+            try:
+                self.regions.save(self.scales.active if self.scales is not None else 1.0)
+            except OSError as e:
+                self.logger.warning(f"無法保存搜尋區域: {e}")
+            self.logger.info(f"等待畫面轉換統計: {self.wait_stats}")
 
     def stop(self):
         self.is_running = False
 
     def main_loop(self):
         self.state.reset()  # 重置所有狀態
+        if self.screen_states is not None:
+            self.screen_states.reset()
+        
+        if self.config.get('pipeline', {}).get('enabled', False):
+            self.pipeline_loop()
+            return
 
         while self.is_running:
-            if not win32gui.IsWindow(self.game_window.hwnd):
+            if self.window_required and not self.game_window.is_valid():
                 if not self.find_game_window(): break
 
             # 檢查主要圖片
             self.handle_main_images()
-            time.sleep(0.5)
+            self.metrics.tick()
+            self.poll_wait("main")
+
+    def pipeline_loop(self):
+        """流水線模式：擷取與檢測在背景執行緒，主執行緒只負責按鍵操作"""
+        self.pipeline = Pipeline(self.grab_frame, self.detect_main_images,
+                                 last_input=lambda: self.last_input_time,
+                                 **Pipeline.options_from_config(self.config))
+        self.pipeline.start()
+        self.logger.info("已啟動流水線模式")
+        try:
+            while self.is_running:
+                if self.window_required and not self.game_window.is_valid():
+                    if not self.find_game_window(): break
+                    
+                detection = self.pipeline.next_detection(timeout=0.5)
+                if detection is None:
+                    continue
+                frame, results = detection
+                # 動作處理中也會檢測與更新畫面狀態，期間暫停檢測執行緒
+                with self.pipeline.paused():
+                    acted = self.act_on_main_images(results)
+                if acted:
+                    self.pipeline.stats.acted += 1
+                self.metrics.tick()
+        finally:
+            self.pipeline.stop()
+            self.logger.info(f"流水線統計: {self.pipeline.report()}")
+            self.pipeline = None
 
 def main(): #主函數
     log_file = setup_logging()
@@ -566,6 +870,7 @@ def main(): #主函數
         logging.error(f"錯誤詳情:\n{traceback.format_exc()}")
     finally:
         logging.info("程式結束")
+        log_setup.stop_logging()
 
 if __name__ == "__main__":
     main()
@@ -1,15 +1,18 @@
 import os
 import time
-import win32api
 import win32con
 import win32gui
 import cv2
-import numpy as np
-from pathlib import Path
 import logging
-from datetime import datetime
 import pyautogui
 import json
+from template_registry import TemplateRegistry
+from detector import Frame, TemplateDetector
+from search_regions import SearchRegions
+from scale_manager import ScaleManager
+from frame_source import create_frame_source
+from input_backend import create_input_backend
+import log_setup
 
 class ImageHandler:
     def __init__(self):
@@ -23,6 +26,21 @@ class ImageHandler:
         with open('config.json', 'r') as f:
             self.config = json.load(f)
         
+        # 啟動時預先載入所有模板
+        self.templates = TemplateRegistry.from_config(self.config)
+        detector_options = TemplateDetector.options_from_config(self.config)
+        # 這個腳本的閾值是以彩色 TM_CCOEFF_NORMED 單一方法調整的，不使用 detection.default_method
+        detector_options['methods'] = [cv2.TM_CCOEFF_NORMED]
+        self.frame_source = create_frame_source(self.config, lambda: self.hwnd, self.templates)
+        self.input = create_input_backend(self.config, lambda: self.hwnd)
+        self.regions = SearchRegions.from_config(self.config)
+        self.detector = TemplateDetector(self.templates, self.config["thresholds"], tolerance=0,
+                                         regions=self.regions, **detector_options)
+        self.scales = ScaleManager.from_config(self.config, self.templates)
+        if self.scales is not None:
+            self.scales.default_methods = detector_options['methods']
+        self.window_size = None
+        
         # 定義按鍵映射
         self.KEYS = {
             "RIGHT": ord('D'),
@@ -41,33 +59,9 @@ class ImageHandler:
         }
 
     def _setup_logging(self):
-        """設置日誌"""
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-        
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_file = log_dir / f"image_handler_{current_time}.log"
-        
-        # 為文件使用完整格式（包含時間）
-        file_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-        
-        # 為控制台使用簡化格式（不含時間）
-        console_formatter = logging.Formatter('[%(levelname)s] %(message)s')
-        
-        # 添加文件處理器
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setFormatter(file_formatter)
-        
-        # 添加控制台處理器
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(console_formatter)
-        
-        logger = logging.getLogger(__name__)
-        logger.setLevel(logging.INFO)
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-        
-        return logger
+        """設置日誌 (整個程式共用一組背景輸出的 handler，重複建立物件不會重複加入)"""
+        log_setup.setup_logging("image_handler", console_format='[%(levelname)s] %(message)s')
+        return logging.getLogger(__name__)
 
     def find_window(self):
         """查找遊戲視窗"""
@@ -79,39 +73,32 @@ class ImageHandler:
         self.logger.info(f"找到遊戲視窗，句柄: {self.hwnd}")
         return True
 
-    def press_key(self, key):
-        """按下並釋放按鍵"""
+    def press_key(self, key, times=1, gap=None):
+        """按下並釋放按鍵，times 大於 1 時一次送出整個序列"""
         try:
             if not self.hwnd or not win32gui.IsWindow(self.hwnd):
                 if not self.find_window():
                     return
             
-            # 嘗試激活窗口
-            foreground_success = False
+            # 檢查窗口是否最小化
+            if win32gui.IsIconic(self.hwnd):
+                # 如果最小化，先恢復窗口
+                win32gui.ShowWindow(self.hwnd, win32con.SW_RESTORE)
+                time.sleep(0.5)
+            
+            input_options = self.config.get('input', {})
+            hold = input_options.get('hold', 0.1)
+            gap = input_options.get('gap', 0.3) if gap is None else gap
             try:
-                # 檢查窗口是否最小化
-                if win32gui.IsIconic(self.hwnd):
-                    # 如果最小化，先恢復窗口
-                    win32gui.ShowWindow(self.hwnd, win32con.SW_RESTORE)
-                    time.sleep(0.5)
-                
-                # 嘗試切換到前台
-                win32gui.SetForegroundWindow(self.hwnd)
-                foreground_success = True
+                # 只有視窗失去焦點時才重新設定前台
+                self.input.press_sequence([key] * times, hold, gap)
             except Exception as e:
-                self.logger.warning(f"無法將窗口設為前台，嘗試使用備用方法: {str(e)}")
-            
-            time.sleep(0.1)
-            
-            # 如果窗口激活成功，使用win32api發送按鍵
-            if foreground_success:
-                scan_code = win32api.MapVirtualKey(key, 0)
-                win32api.keybd_event(key, scan_code, 0, 0)
-                time.sleep(0.1)
-                win32api.keybd_event(key, scan_code, win32con.KEYEVENTF_KEYUP, 0)
-            else:
+                self.logger.warning(f"無法送出按鍵，嘗試使用備用方法: {str(e)}")
                 # 備用方法：使用pyautogui發送按鍵
-                self._send_key_with_pyautogui(key)
+                for i in range(times):
+                    self._send_key_with_pyautogui(key)
+                    if i < times - 1:
+                        time.sleep(gap)
             
         except Exception as e:
             self.logger.error(f"按鍵操作出錯: {str(e)}")
@@ -170,14 +157,15 @@ class ImageHandler:
             if width <= 0 or height <= 0:
                 self.logger.error(f"視窗大小異常: {width}x{height}")
                 return None
+            self.window_size = (width, height)
             
             try:
-                screenshot = pyautogui.screenshot(region=(left, top, width, height))
-                screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-                self.logger.debug(f"截圖大小: {screenshot.shape}")
+                screenshot = self.frame_source.grab()
+                if screenshot is not None:
+                    self.logger.debug(f"截圖大小: {screenshot.shape}")
                 return screenshot
             except Exception as e:
-                self.logger.error(f"pyautogui截圖失敗: {str(e)}")
+                self.logger.error(f"截圖失敗: {str(e)}")
                 return None
             
         except Exception as e:
@@ -186,12 +174,18 @@ class ImageHandler:
             self.logger.error(f"錯誤詳情: {traceback.format_exc()}")
             return None
 
-    def detect_image(self, image_key, threshold=None):
+    def capture_frame(self):
+        """擷取一張截圖供本次掃描的所有模板共用"""
+        screenshot = self.get_screenshot()
+        if screenshot is None:
+            return None
+        return Frame(screenshot)
+
+    def detect_image(self, image_key, threshold=None, frame=None):
         """檢測圖片"""
         try:
-            # 從配置文件獲取圖片路徑
-            image_path = self.config["image_paths"].get(image_key)
-            if not image_path:
+            # 從註冊表獲取預先載入的模板
+            if image_key not in self.templates:
                 self.logger.error(f"找不到圖片配置: {image_key}")
                 return False, None
                 
@@ -200,26 +194,28 @@ class ImageHandler:
                 threshold = self.config["thresholds"].get(image_key, 0.8)
             
             # 顯示當前查找的圖片和閾值
-            self.logger.info(f"查找: {image_key} - 閾值: {threshold:.2f}")
+            self.logger.info(f"查找: {image_key} - 閾值: {threshold:.2f}", extra={'throttle': f"find:{image_key}"})
                 
-            screenshot = self.get_screenshot()
-            if screenshot is None:
-                return False, None
+            if frame is None:
+                frame = self.capture_frame()
+                if frame is None:
+                    return False, None
                 
-            template = cv2.imread(image_path)
-            if template is None:
-                self.logger.error(f"無法讀取圖片: {image_path}")
-                return False, None
+            if self.scales is not None:
+                # 視窗大小改變或尚未鎖定縮放比例時才會重新縮放模板
+                factor = self.scales.update(frame, [image_key], self.window_size)
+                if factor is not None:
+                    self.detector.registry = self.scales.registry
+                    self.regions.rescale(factor)
                 
-            result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            result = self.detector.match(frame, image_key, threshold)
             
             # 顯示匹配結果
-            self.logger.info(f"結果: {image_key} - 匹配值: {max_val:.2f}")
+            self.logger.info(f"結果: {image_key} - 匹配值: {result.score:.2f}", extra={'throttle': f"score:{image_key}"})
             
-            if max_val >= threshold:  # 使用閾值而不是固定的0.99
+            if result.found:  # 使用閾值而不是固定的0.99
                 self.logger.info(f"匹配成功: {image_key} - 執行操作")
-                return True, max_loc
+                return True, result.loc
             return False, None
             
         except Exception as e:
@@ -242,9 +238,15 @@ class ImageHandler:
         ]
         
         while self.is_running:
+            # 每次掃描只截圖一次
+            frame = self.capture_frame()
+            if frame is None:
+                time.sleep(0.5)
+                continue
+                
             # 按照流程順序檢測圖片
             for image_key in flow_images:
-                if self.detect_image(image_key)[0]:
+                if self.detect_image(image_key, frame=frame)[0]:
                     if image_key == "new_content":
                         self.logger.info("找到全新內容 → 按E鍵")
                         self.press_key(self.KEYS["E"])
@@ -258,16 +260,14 @@ class ImageHandler:
                         self.press_key(self.KEYS["SPACE"])
                         time.sleep(1)
                         # 按D鍵8次
-                        for _ in range(8):
-                            self.press_key(self.KEYS["RIGHT"])
-                            time.sleep(0.2)
+                        self.press_key(self.KEYS["RIGHT"], times=8, gap=0.2)
+                        time.sleep(0.2)
                         break
                         
                     elif image_key == "domination_home":
                         self.logger.info("找到稱霸賽主頁 → 按S鍵")
-                        for i in range(5):
-                            self.press_key(self.KEYS["S"])
-                            time.sleep(0.5)
+                        self.press_key(self.KEYS["S"], times=5, gap=0.5)
+                        time.sleep(0.5)
                         break
                         
                     elif image_key == "mycareer":
@@ -320,9 +320,8 @@ class ImageHandler:
         
         # 選擇難度
         self.logger.info("選擇難度 → 按S鍵")
-        for _ in range(2):
-            self.press_key(self.KEYS["S"])
-            time.sleep(0.5)
+        self.press_key(self.KEYS["S"], times=2, gap=0.5)
+        time.sleep(0.5)
         
         # 確認難度
         self.press_key(self.KEYS["SPACE"])
@@ -345,26 +344,30 @@ class ImageHandler:
 
     def handle_game_buttons(self):
         """處理遊戲中的按鈕"""
-        if self.detect_image("forward")[0]:
+        frame = self.capture_frame()
+        if frame is None:
+            return False
+            
+        if self.detect_image("forward", frame=frame)[0]:
             self.logger.info("找到前進按鈕 → 按空格")
             self.press_key(self.KEYS["SPACE"])
             time.sleep(0.5)
             return True
             
-        elif self.detect_image("pause")[0]:
+        elif self.detect_image("pause", frame=frame)[0]:
             self.logger.info("找到暫停按鈕 → 按空格")
             self.press_key(self.KEYS["SPACE"])
             time.sleep(0.5)
             return True
             
-        elif self.detect_image("continue")[0]:
+        elif self.detect_image("continue", frame=frame)[0]:
             self.logger.info("找到繼續按鈕 → 按空格")
             self.press_key(self.KEYS["SPACE"])
             self.state['in_domination'] = False
             time.sleep(0.5)
             return True
             
-        elif self.detect_image("three_stars")[0]:
+        elif self.detect_image("three_stars", frame=frame)[0]:
             self.logger.info("找到三星圖片 → 開始遊戲")
             self.trigger_game_start()
             return True
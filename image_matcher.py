@@ -9,7 +9,18 @@ from pathlib import Path
 import win32process
 from PIL import ImageGrab
 from ctypes import windll
-import pyautogui  # 添加 pyautogui 導入
+from frame_source import WindowDCSource
+
+# 每個視窗重複使用同一個截圖來源，不需要每次重新建立擷取或切換焦點
+_frame_sources = {}
+
+# 依畫面高度縮放後的模板 {(模板路徑, 畫面高度): 模板}，視窗大小不變時不會重新讀取或縮放
+_scaled_templates = {}
+
+def get_frame_source(hwnd):
+    if hwnd not in _frame_sources:
+        _frame_sources[hwnd] = WindowDCSource(lambda: hwnd)
+    return _frame_sources[hwnd]
 
 def get_window_screenshot(hwnd):
     try:
@@ -21,10 +32,11 @@ def get_window_screenshot(hwnd):
         
         print(f"視窗大小: 寬度={width}, 高度={height}")
         
-        # 使用 pyautogui 截圖
-        screenshot = pyautogui.screenshot(region=(left, top, width, height))
-        # 轉換為 OpenCV 格式 (BGR)
-        screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+        # 使用持續保留的視窗 DC 截圖
+        screenshot = get_frame_source(hwnd).grab()
+        if screenshot is None:
+            print("截圖失敗")
+            return None
         
         # 保存截圖用於調試
         cv2.imwrite("debug_screenshot.png", screenshot)
@@ -111,19 +123,31 @@ def set_foreground_window(hwnd):
         win32process.AttachThreadInput(target_thread, current_process, False)
         win32process.AttachThreadInput(current_thread, current_process, False)
 
-def detect_image(hwnd, template_path, threshold=0.5):
+def get_scaled_template(template_path, screen_height):
+    """讀取模板並依畫面高度縮放 (假設模板是在1080p下截取的)，結果會快取"""
+    cache_key = (str(template_path), screen_height)
+    if cache_key not in _scaled_templates:
+        template = cv2.imread(str(template_path))
+        if template is None:
+            return None
+        
+        # 根據解析度調整模板大小
+        scale_ratio = screen_height / 1080
+        if abs(scale_ratio - 1.0) > 0.1:  # 如果解析度差異超過10%
+            new_width = int(template.shape[1] * scale_ratio)
+            new_height = int(template.shape[0] * scale_ratio)
+            template = cv2.resize(template, (new_width, new_height))
+            print(f"調整模板尺寸至: {template.shape} (縮放比例: {scale_ratio:.2f})")
+        _scaled_templates[cache_key] = template
+    return _scaled_templates[cache_key]
+
+def detect_image(hwnd, template_path, threshold=0.5, region=None, focus=False):
     if not Path(template_path).exists():
         print(f"找不到圖片：{template_path}")
         return False
         
-    # 讀取模板圖片
-    template = cv2.imread(str(template_path))
-    if template is None:
-        print(f"無法讀取圖片：{template_path}")
-        return False
-        
-    # 嘗試將窗口置於前台
-    if not set_foreground_window(hwnd):
+    # 截圖不需要焦點，只有明確要求時才將窗口置於前台
+    if focus and not set_foreground_window(hwnd):
         print("無法將窗口置於前台")
         
     # 獲取截圖
@@ -132,24 +156,27 @@ def detect_image(hwnd, template_path, threshold=0.5):
         print("截圖失敗")
         return False
         
+    template = get_scaled_template(template_path, screenshot_cv.shape[0])
+    if template is None:
+        print(f"無法讀取圖片：{template_path}")
+        return False
     print(f"截圖尺寸: {screenshot_cv.shape}, 模板尺寸: {template.shape}")
     
-    # 計算解析度比例
-    screen_height = screenshot_cv.shape[0]
-    template_height = template.shape[0]
-    scale_ratio = screen_height / 1080  # 假設模板是在1080p下截取的
-    
-    # 根據解析度調整模板大小
-    if abs(scale_ratio - 1.0) > 0.1:  # 如果解析度差異超過10%
-        new_width = int(template.shape[1] * scale_ratio)
-        new_height = int(template.shape[0] * scale_ratio)
-        template = cv2.resize(template, (new_width, new_height))
-        print(f"調整模板尺寸至: {template.shape} (縮放比例: {scale_ratio:.2f})")
-    
     # 圖像預處理
     screenshot_gray = cv2.cvtColor(screenshot_cv, cv2.COLOR_BGR2GRAY)
     template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
     
+    # 只在指定的搜尋區域 (x, y, w, h) 內匹配
+    offset = (0, 0)
+    if region is not None:
+        x, y, w, h = region
+        search_gray = screenshot_gray[y:y+h, x:x+w]
+        if search_gray.shape[0] >= template_gray.shape[0] and search_gray.shape[1] >= template_gray.shape[1]:
+            screenshot_gray = search_gray
+            offset = (x, y)
+        else:
+            print(f"搜尋區域小於模板，改為搜尋整個畫面: {region}")
+    
     # 使用不同的匹配方法
     methods = [cv2.TM_CCOEFF_NORMED, cv2.TM_CCORR_NORMED]
     max_val = 0
@@ -161,7 +188,7 @@ def detect_image(hwnd, template_path, threshold=0.5):
         _, val, _, loc = cv2.minMaxLoc(result)
         if val > max_val:
             max_val = val
-            max_loc = loc
+            max_loc = (loc[0] + offset[0], loc[1] + offset[1])
             best_method = method
     
     # 顯示結果
@@ -325,5 +352,7 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\n使用者中斷程式")
     finally:
+        for source in _frame_sources.values():
+            source.close()
         cv2.destroyAllWindows()
         print("程式已結束") 
\ No newline at end of file
@@ -0,0 +1,184 @@
+import time
+import logging
+
+# 常用虛擬鍵碼 (與 win32con 相同，不需要匯入 win32)
+VK_SPACE = 0x20
+VK_ESCAPE = 0x1B
+
+KEYEVENTF_KEYUP = 0x0002
+KEYEVENTF_SCANCODE = 0x0008
+INPUT_KEYBOARD = 1
+
+
+class InputBackend:
+    """按鍵輸入介面：press_sequence() 依序送出按鍵，每個按鍵按住 hold 秒、之後間隔 gap 秒"""
+
+    # 是否需要有效的遊戲視窗才能送出按鍵
+    requires_window = False
+
+    def __init__(self, get_hwnd=None, focus_delay=0.1):
+        self.logger = logging.getLogger(__name__)
+        self.get_hwnd = get_hwnd or (lambda: None)
+        self.focus_delay = focus_delay
+        self.focus_changes = 0
+        self.presses = 0
+
+    def has_focus(self):
+        return True
+
+    def focus(self, hwnd):
+        """把視窗設為前台"""
+
+    def ensure_focus(self):
+        """只有視窗失去焦點時才重新設定前台並等待 focus_delay"""
+        if self.has_focus():
+            return
+        self.focus(self.get_hwnd())
+        self.focus_changes += 1
+        if self.focus_delay:
+            time.sleep(self.focus_delay)
+
+    def press(self, key, hold=0.1, gap=0.0):
+        self.press_sequence([key], hold, gap)
+
+    def press_sequence(self, keys, hold=0.1, gap=0.0):
+        self.ensure_focus()
+        self.send(list(keys), hold, gap)
+        self.presses += len(keys)
+
+    def send(self, keys, hold, gap):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'presses': self.presses, 'focus_changes': self.focus_changes}
+
+    def close(self):
+        """釋放持有的資源"""
+
+
+class Win32Backend(InputBackend):
+    """Windows 共用部分：以前台視窗判斷是否需要重新設定焦點"""
+
+    requires_window = True
+
+    def has_focus(self):
+        import win32gui
+        hwnd = self.get_hwnd()
+        return bool(hwnd) and win32gui.GetForegroundWindow() == hwnd
+
+    def focus(self, hwnd):
+        import win32gui
+        win32gui.SetForegroundWindow(hwnd)
+
+
+class KeybdEventBackend(Win32Backend):
+    """原本的做法：每個按鍵各呼叫一次 keybd_event 按下與放開"""
+
+    def send(self, keys, hold, gap):
+        import win32api
+        for i, key in enumerate(keys):
+            scan_code = win32api.MapVirtualKey(key, 0)
+            win32api.keybd_event(key, scan_code, 0, 0)
+            time.sleep(hold)
+            win32api.keybd_event(key, scan_code, KEYEVENTF_KEYUP, 0)
+            if gap and i < len(keys) - 1:
+                time.sleep(gap)
+
+
+_structures = None
+
+
+def _input_structures():
+    """SendInput 使用的 ctypes 結構 (只在 Windows 上建立)"""
+    global _structures
+    if _structures is None:
+        import ctypes
+        from ctypes import wintypes
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                        ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                        ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+        class HARDWAREINPUT(ctypes.Structure):
+            _fields_ = [("uMsg", wintypes.DWORD), ("wParamL", wintypes.WORD), ("wParamH", wintypes.WORD)]
+
+        class INPUT_UNION(ctypes.Union):
+            _fields_ = [("ki", KEYBDINPUT), ("mi", MOUSEINPUT), ("hi", HARDWAREINPUT)]
+
+        class INPUT(ctypes.Structure):
+            _fields_ = [("type", wintypes.DWORD), ("union", INPUT_UNION)]
+
+        _structures = (ctypes, KEYBDINPUT, INPUT)
+    return _structures
+
+
+class SendInputBackend(Win32Backend):
+    """以 SendInput 送出按鍵，沒有間隔的連續事件合併成一次呼叫"""
+
+    def _submit(self, events):
+        ctypes, KEYBDINPUT, INPUT = _input_structures()
+        user32 = ctypes.windll.user32
+        inputs = (INPUT * len(events))()
+        for item, (key, up) in zip(inputs, events):
+            scan_code = user32.MapVirtualKeyW(key, 0)
+            item.type = INPUT_KEYBOARD
+            item.union.ki = KEYBDINPUT(0, scan_code, KEYEVENTF_SCANCODE | (KEYEVENTF_KEYUP if up else 0), 0, 0)
+        sent = user32.SendInput(len(events), inputs, ctypes.sizeof(INPUT))
+        if sent != len(events):
+            raise OSError(f"SendInput 只送出 {sent}/{len(events)} 個事件")
+
+    def send(self, keys, hold, gap):
+        # 事件依等待時間分段，每段只呼叫一次 SendInput
+        events = []
+        for i, key in enumerate(keys):
+            events.append((key, False))
+            if hold:
+                self._submit(events)
+                events = []
+                time.sleep(hold)
+            events.append((key, True))
+            if gap and i < len(keys) - 1:
+                self._submit(events)
+                events = []
+                time.sleep(gap)
+        if events:
+            self._submit(events)
+
+
+class RecordingBackend(InputBackend):
+    def __init__(self, get_hwnd=None, focus_delay=0.0, sleep=False): #記錄按鍵的假輸入 (測試用)
+        super().__init__(get_hwnd, focus_delay)
+        self.sleep = sleep
+        self.events = []
+
+    def send(self, keys, hold, gap):
+        for key in keys:
+            self.events.append((time.time(), key, hold, gap))
+        if self.sleep:
+            time.sleep(len(keys) * hold + max(0, len(keys) - 1) * gap)
+
+    @property
+    def keys(self):
+        """依序返回送出的按鍵"""
+        return [key for _, key, _, _ in self.events]
+
+    def clear(self):
+        self.events = []
+
+
+def create_input_backend(config, get_hwnd=None):
+    """根據 config.json 的 input 設定建立輸入方式"""
+    options = config.get('input', {})
+    backend = options.get('backend', 'keybd_event')
+    focus_delay = options.get('focus_delay', 0.1)
+    if backend == 'sendinput':
+        return SendInputBackend(get_hwnd, focus_delay)
+    if backend == 'recording':
+        return RecordingBackend(get_hwnd, focus_delay=0.0)
+    if backend != 'keybd_event':
+        logging.getLogger(__name__).warning(f"未知的輸入方式 {backend}，改用 keybd_event")
+    return KeybdEventBackend(get_hwnd, focus_delay)
@@ -0,0 +1,105 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+from pathlib import Path
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+_log_file = None
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=5.0): #限制熱路徑重複訊息的頻率
+        super().__init__()
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        """帶有 extra={'throttle': 名稱} 的訊息每 interval 秒最多輸出一次，
+        輸出時附上期間略過的次數"""
+        key = getattr(record, 'throttle', None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, float('-inf')) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} (上次輸出後略過 {suppressed} 次相同訊息)"
+            record.args = None
+        return True
+
+
+def setup_logging(prefix="game_log", max_files=5, interval=5.0, console_format='%(message)s'):
+    """設定根 logger：呼叫端只把訊息放進佇列，檔案與主控台在背景執行緒輸出
+    已經設定過時直接返回原本的日誌檔"""
+    global _listener, _queue_handler, _log_file
+    with _lock:
+        if _listener is not None:
+            return _log_file
+
+        log_dir = Path("logs")
+        log_dir.mkdir(exist_ok=True)
+
+        # 限制日志文件数量
+        log_files = sorted(log_dir.glob(f"{prefix}_*.log"), key=lambda x: x.stat().st_mtime, reverse=True)
+        for old_log in log_files[max_files-1:]:
+            try:
+                old_log.unlink()
+            except Exception as e:
+                print(f"无法删除旧日志文件 {old_log}: {e}")
+
+        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_file = log_dir / f"{prefix}_{current_time}.log"
+
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter(console_format))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter(interval))
+
+        root_logger = logging.getLogger()
+        root_logger.setLevel(logging.INFO)
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                                   respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        _queue_handler = queue_handler
+        _log_file = log_file
+        return log_file
+
+
+def stop_logging():
+    """輸出佇列中剩餘的訊息並停止背景執行緒"""
+    global _listener, _queue_handler, _log_file
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = _queue_handler = _log_file = None
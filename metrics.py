@@ -0,0 +1,215 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+
+PREFIX = "nba2k"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, window=2048): #延遲分佈，百分位數以最近 window 筆計算
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def quantiles(self):
+        """返回 {分位數: 秒}，尚無資料時返回空字典"""
+        with self._lock:
+            samples = np.array(self._samples)
+        if not samples.size:
+            return {}
+        return dict(zip(QUANTILES, np.quantile(samples, QUANTILES).tolist()))
+
+
+class Metrics:
+    def __init__(self, window=2048, rate_window=10.0): #各階段延遲、命中次數與每秒循環數
+        self.logger = logging.getLogger(__name__)
+        self.window = window
+        self.rate_window = rate_window
+        self.histograms = {}
+        self.matches = {}
+        self.ticks = 0
+        self._tick_times = deque()
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.port = None
+        self.snapshot_path = None
+        self.snapshot_interval = 60.0
+        self._server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立；統計一律在記憶體中收集，enabled 只控制 HTTP 端點與 JSON 快照"""
+        options = config.get('metrics', {})
+        metrics = cls(window=options.get('window', 2048))
+        if options.get('enabled', False):
+            metrics.port = options.get('port')
+            metrics.snapshot_path = options.get('snapshot_path')
+            metrics.snapshot_interval = options.get('snapshot_interval', 60.0)
+        return metrics
+
+    def histogram(self, stage, key=None):
+        name = (stage, key)
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram(self.window))
+        return histogram
+
+    def observe(self, stage, seconds, key=None):
+        """記錄一次階段耗時，key 用來區分模板"""
+        self.histogram(stage, key).observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, key=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, key)
+
+    def count_match(self, key, found):
+        """記錄模板命中或未命中"""
+        with self._lock:
+            counts = self.matches.setdefault(key, [0, 0])
+            counts[0 if found else 1] += 1
+
+    def tick(self):
+        """主循環每完成一次呼叫一次"""
+        now = time.monotonic()
+        with self._lock:
+            self.ticks += 1
+            self._tick_times.append(now)
+            while self._tick_times and now - self._tick_times[0] > self.rate_window:
+                self._tick_times.popleft()
+
+    def ticks_per_second(self):
+        with self._lock:
+            if len(self._tick_times) < 2:
+                return 0.0
+            span = self._tick_times[-1] - self._tick_times[0]
+            return (len(self._tick_times) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        """返回可寫成 JSON 的統計資料 (延遲單位為毫秒)"""
+        stages = {}
+        for (stage, key), histogram in list(self.histograms.items()):
+            entry = {'count': histogram.count, 'total_ms': round(histogram.total * 1000, 3)}
+            for q, value in histogram.quantiles().items():
+                entry[f"p{round(q * 100)}_ms"] = round(value * 1000, 3)
+            stages.setdefault(stage, {})[key or '_all'] = entry
+        with self._lock:
+            matches = {key: {'hit': hit, 'miss': miss} for key, (hit, miss) in self.matches.items()}
+        return {
+            'timestamp': time.time(),
+            'uptime': round(time.time() - self.started, 1),
+            'ticks': self.ticks,
+            'ticks_per_second': round(self.ticks_per_second(), 3),
+            'stages': stages,
+            'matches': matches,
+        }
+
+    def prometheus(self):
+        """Prometheus 文字格式"""
+        lines = [f"# HELP {PREFIX}_stage_seconds 各階段耗時",
+                 f"# TYPE {PREFIX}_stage_seconds summary"]
+        for (stage, key), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            labels = f'stage="{stage}"' + (f',key="{key}"' if key else '')
+            for q, value in histogram.quantiles().items():
+                lines.append(f'{PREFIX}_stage_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"{PREFIX}_stage_seconds_sum{{{labels}}} {histogram.total:.6f}")
+            lines.append(f"{PREFIX}_stage_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += [f"# HELP {PREFIX}_template_matches_total 模板命中與未命中次數",
+                  f"# TYPE {PREFIX}_template_matches_total counter"]
+        with self._lock:
+            matches = sorted(self.matches.items())
+        for key, (hit, miss) in matches:
+            lines.append(f'{PREFIX}_template_matches_total{{key="{key}",result="hit"}} {hit}')
+            lines.append(f'{PREFIX}_template_matches_total{{key="{key}",result="miss"}} {miss}')
+
+        lines += [f"# TYPE {PREFIX}_ticks_total counter", f"{PREFIX}_ticks_total {self.ticks}",
+                  f"# TYPE {PREFIX}_ticks_per_second gauge",
+                  f"{PREFIX}_ticks_per_second {self.ticks_per_second():.3f}"]
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self):
+        path = Path(self.snapshot_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_suffix(path.suffix + ".tmp")
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=4, ensure_ascii=False)
+        temp.replace(path)
+
+    def start(self):
+        """啟動 localhost HTTP 端點與定期 JSON 快照 (有設定時)"""
+        self._stop.clear()
+        if self.port:
+            # http.server 連帶匯入 email 等模組，只在啟用端點時才匯入
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip('/') not in ('', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.prometheus().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+                self._threads.append(threading.Thread(target=self._server.serve_forever,
+                                                      name="metrics-http", daemon=True))
+                self.logger.info(f"效能指標: http://127.0.0.1:{self.port}/metrics")
+            except OSError as e:
+                self.logger.warning(f"無法啟動效能指標端點: {e}")
+                self._server = None
+        if self.snapshot_path:
+            self._threads.append(threading.Thread(target=self._snapshot_loop, name="metrics-snapshot", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                self.logger.warning(f"寫入效能快照失敗: {e}")
+
+    def stop(self):
+        """停止端點並寫入最後一次快照"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        if self.snapshot_path:
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                self.logger.warning(f"寫入效能快照失敗: {e}")
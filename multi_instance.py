@@ -0,0 +1,244 @@
+import os
+import copy
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from template_registry import TemplateRegistry
+from fft_matcher import FFTCorrelator
+from metrics import Metrics
+from game_loop import GameLoop, GameWindow
+import log_setup
+
+
+class FairGate:
+    def __init__(self, slots=1): #先到先服務的輪流機制
+        """同時最多 slots 個視窗進入，其餘依到達順序排隊；
+        用完馬上再排隊的視窗會排在其他等待者後面，不會一直搶到"""
+        self.slots = slots
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+        self.waits = {}
+
+    @contextmanager
+    def turn(self, name=None):
+        ticket = object()
+        started = time.perf_counter()
+        with self._condition:
+            self._queue.append(ticket)
+            while self._queue[0] is not ticket or self._active >= self.slots:
+                self._condition.wait()
+            self._queue.popleft()
+            self._active += 1
+            waits = self.waits.setdefault(name, [0, 0.0])
+            waits[0] += 1
+            waits[1] += time.perf_counter() - started
+            # 還有空位時讓下一位也可以進入
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def stats(self):
+        """返回 {視窗: {'turns': 次數, 'wait_ms': 累計等待毫秒}}"""
+        with self._condition:
+            return {name: {'turns': count, 'wait_ms': round(seconds * 1000, 1)}
+                    for name, (count, seconds) in self.waits.items()}
+
+
+class SharedResources:
+    def __init__(self, config, concurrent_scans=1): #多個遊戲視窗共用的資源
+        """模板、各縮放比例的模板組、頻域頻譜快取與比對執行緒池都只建立一次；
+        比對與按鍵以 FairGate 讓各視窗輪流使用"""
+        self.templates = TemplateRegistry.from_config(config)
+        self.fft = FFTCorrelator.from_config(config)
+        self._scaled = {}
+        self._lock = threading.Lock()
+        workers = config.get('detection', {}).get('workers', 0)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="matcher") if workers > 1 else None
+        self.gates = {'detect': FairGate(concurrent_scans), 'input': FairGate(1)}
+        self.window = config.get('metrics', {}).get('window', 2048)
+        self.metrics = {}
+
+    def at_scale(self, scale):
+        """所有視窗共用的縮放模板組 (ScaleManager 使用)"""
+        scale = round(float(scale), 4)
+        with self._lock:
+            registry = self._scaled.get(scale)
+            if registry is None:
+                registry = self._scaled[scale] = self.templates.at_scale(scale)
+            return registry
+
+    def metrics_for(self, name):
+        """每個視窗各自的統計 (不啟動 HTTP 端點，由 MultiInstanceRunner 統一輸出)"""
+        metrics = self.metrics[name] = Metrics(window=self.window)
+        return metrics
+
+    def turn(self, kind, name):
+        return self.gates[kind].turn(name)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+class FakeGameWindow(GameWindow):
+    def __init__(self, hwnd, frame_source=None, size=(1920, 1080)): #假視窗 (Linux 測試用)
+        self.size = tuple(size)
+        super().__init__(f"fake-{hwnd}", frame_source, hwnd=hwnd)
+
+    def find_window(self):
+        return True
+
+    def is_valid(self):
+        return True
+
+    def is_minimized(self):
+        return False
+
+    def get_window_rect(self):
+        return (0, 0, *self.size)
+
+
+def find_windows(title):
+    """列出標題為 title 的所有可見視窗句柄"""
+    import win32gui
+    handles = []
+
+    def collect(hwnd, _):
+        if win32gui.IsWindowVisible(hwnd) and win32gui.GetWindowText(hwnd) == title:
+            handles.append(hwnd)
+        return True
+
+    win32gui.EnumWindows(collect, None)
+    return handles
+
+
+class MultiInstanceRunner:
+    def __init__(self, config, windows, concurrent_scans=1): #同一個程序操作多個遊戲視窗
+        """每個視窗各自一個 GameLoop 狀態機與執行緒，模板與比對執行緒池共用"""
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.shared = SharedResources(config, concurrent_scans)
+        self.loops = {}
+        for window in windows:
+            name = str(window.hwnd)
+            self.loops[name] = GameLoop(self.instance_config(name), game_window=window,
+                                        shared=self.shared, name=name)
+        self._threads = []
+        options = config.get('metrics', {})
+        self.snapshot_path = options.get('snapshot_path') if options.get('enabled', False) else None
+        self.snapshot_interval = options.get('snapshot_interval', 60.0)
+
+    @classmethod
+    def from_config(cls, config, hwnds=None, fake=0):
+        """依 multi_instance 設定建立：fake 大於 0 時使用假視窗，否則使用 hwnds 或列舉所有同名視窗"""
+        options = config.get('multi_instance', {})
+        fake = fake or options.get('fake_windows', 0)
+        if fake:
+            windows = [FakeGameWindow(index + 1) for index in range(fake)]
+        else:
+            hwnds = hwnds or options.get('hwnds') or find_windows(options.get('window_title', "NBA 2K25"))
+            windows = [GameWindow(options.get('window_title', "NBA 2K25"), hwnd=hwnd) for hwnd in hwnds]
+        return cls(config, windows, concurrent_scans=options.get('concurrent_scans', 1))
+
+    def instance_config(self, name):
+        """各視窗的設定：調試圖片分開目錄，合成畫面使用不同的亂數種子"""
+        config = copy.deepcopy(self.config)
+        debug = config.get('debug', {})
+        if 'directory' in debug:
+            debug['directory'] = os.path.join(debug['directory'], name)
+        synthetic = config.get('capture', {}).get('synthetic')
+        if synthetic is not None:
+            synthetic['seed'] = synthetic.get('seed', 0) + len(self.loops)
+        return config
+
+    def run(self):
+        """啟動所有視窗並等待結束，Ctrl+C 時停止全部"""
+        if not self.loops:
+            self.logger.error("未找到任何遊戲視窗")
+            return
+        self.logger.info(f"同時操作 {len(self.loops)} 個視窗: {', '.join(self.loops)}")
+        self._threads = [threading.Thread(target=loop.start, name=f"game-{name}", daemon=True)
+                         for name, loop in self.loops.items()]
+        for thread in self._threads:
+            thread.start()
+        last_snapshot = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                for thread in self._threads:
+                    thread.join(timeout=0.5)
+                if self.snapshot_path and time.monotonic() - last_snapshot >= self.snapshot_interval:
+                    self.write_snapshot()
+                    last_snapshot = time.monotonic()
+        except KeyboardInterrupt:
+            self.logger.info("使用者中止程式")
+        finally:
+            self.stop()
+            for name, instance in self.report()['instances'].items():
+                self.logger.info(f"[{name}] 每秒循環 {instance['ticks_per_second']}, 共 {instance['ticks']} 次, "
+                                 f"等待輪到比對 {instance['detect_turns']}, 等待輪到按鍵 {instance['input_turns']}")
+            if self.snapshot_path:
+                self.write_snapshot()
+            self.shared.close()
+
+    def stop(self):
+        for loop in self.loops.values():
+            loop.stop()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def report(self):
+        """各視窗的效能統計與輪流等待時間"""
+        gates = {kind: gate.stats() for kind, gate in self.shared.gates.items()}
+        instances = {}
+        for name, loop in self.loops.items():
+            snapshot = loop.metrics.snapshot()
+            snapshot['detect_turns'] = gates['detect'].get(name, {})
+            snapshot['input_turns'] = gates['input'].get(name, {})
+            instances[name] = snapshot
+        return {'timestamp': time.time(), 'instances': instances}
+
+    def write_snapshot(self):
+        path = Path(self.snapshot_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_suffix(path.suffix + ".tmp")
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=4, ensure_ascii=False)
+        temp.replace(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在同一個程序中同時操作多個遊戲視窗")
+    parser.add_argument("--config", default="config.json", help="配置文件路徑")
+    parser.add_argument("--hwnd", type=int, nargs="*", help="指定視窗句柄，預設列舉所有同名視窗")
+    parser.add_argument("--fake", type=int, default=0, help="使用指定數量的假視窗 (搭配 replay/synthetic 截圖與 recording 輸入)")
+    parser.add_argument("--duration", type=float, default=0, help="執行指定秒數後停止 (搭配 --fake 做冒煙測試)")
+    args = parser.parse_args(argv)
+
+    log_setup.setup_logging("multi_instance")
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    try:
+        runner = MultiInstanceRunner.from_config(config, args.hwnd, args.fake)
+        if args.duration > 0:
+            timer = threading.Timer(args.duration, runner.stop)
+            timer.daemon = True
+            timer.start()
+        runner.run()
+    finally:
+        log_setup.stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class LatestSlot:
+    def __init__(self, retain=None, release=None): #只保留最新一筆資料的槽位
+        # retain/release 用來管理共用緩衝區的引用：取出時 retain，被覆蓋時 release
+        self._retain = retain or (lambda item: item)
+        self._release = release or (lambda item: None)
+        self._condition = threading.Condition()
+        self._item = None
+        self._sequence = 0
+        self._consumed = 0
+        self.overwritten = 0
+
+    def put(self, item):
+        """放入新資料，尚未被取走的舊資料直接丟棄"""
+        with self._condition:
+            if self._item is not None:
+                if self._sequence != self._consumed:
+                    self.overwritten += 1
+                self._release(self._item)
+            self._item = item
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def get(self, timeout=None, accept=None):
+        """等待一筆尚未取過且符合 accept 條件的最新資料，逾時返回 None"""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                if self._sequence != self._consumed and (accept is None or accept(self._item)):
+                    self._consumed = self._sequence
+                    return self._retain(self._item)
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def peek(self, timeout=None, accept=None):
+        """等待一筆符合 accept 條件的最新資料但不標記為已取走"""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                if self._item is not None and (accept is None or accept(self._item)):
+                    return self._retain(self._item)
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def clear(self):
+        """丟棄目前的資料"""
+        with self._condition:
+            if self._item is not None:
+                self._release(self._item)
+            self._item = None
+            self._consumed = self._sequence
+
+
+class PipelineStats:
+    def __init__(self): #流水線統計
+        self.captured = 0
+        self.capture_failed = 0
+        self.detected = 0
+        self.acted = 0
+        self.stale_dropped = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def snapshot(self):
+        return dict(vars(self))
+
+
+class Pipeline:
+    def __init__(self, capture, detect, last_input=None, capture_interval=0.1, queue_size=1): #擷取→檢測→動作流水線
+        self.logger = logging.getLogger(__name__)
+        self.capture = capture
+        self.detect = detect
+        # 返回最後一次按鍵的時間，之前擷取的畫面視為過期
+        self.last_input = last_input or (lambda: 0.0)
+        self.capture_interval = capture_interval
+        # 畫面可能來自 FrameRing，取出的畫面由使用者負責 release()
+        self.frames = LatestSlot(retain=lambda frame: frame.retain(), release=lambda frame: frame.release())
+        self.detections = queue.Queue(maxsize=queue_size)
+        self.stats = PipelineStats()
+        # 檢測階段執行中持有；動作階段以 paused() 取得，期間不會與動作內的檢測同時使用檢測器
+        self._detecting = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    @staticmethod
+    def options_from_config(config):
+        """從配置字典讀取流水線參數"""
+        pipeline = config.get('pipeline', {})
+        return {
+            'capture_interval': pipeline.get('capture_interval', 0.1),
+            'queue_size': pipeline.get('queue_size', 1),
+        }
+
+    def start(self):
+        """啟動擷取與檢測執行緒"""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._detect_loop, name="detect", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """停止並等待執行緒結束"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        self.frames.clear()
+
+    def report(self):
+        """返回各階段的計數與背壓統計"""
+        data = self.stats.snapshot()
+        data['frames_overwritten'] = self.frames.overwritten
+        data['queue_depth'] = self.detections.qsize()
+        return data
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                frame = self.capture()
+            except Exception as e:
+                self.logger.error(f"擷取畫面出錯: {str(e)}")
+                frame = None
+            if frame is None:
+                self.stats.capture_failed += 1
+            else:
+                self.stats.captured += 1
+                self.frames.put(frame)
+            self._stop.wait(max(0.0, self.capture_interval - (time.time() - started)))
+
+    def _detect_loop(self):
+        while not self._stop.is_set():
+            # 動作階段還沒取走上一個結果時先等待，不浪費 CPU 檢測會被丟棄的畫面
+            if self.detections.full():
+                self.stats.blocked += 1
+                started = time.time()
+                while self.detections.full() and not self._stop.is_set():
+                    time.sleep(0.01)
+                self.stats.blocked_seconds += time.time() - started
+                continue
+
+            frame = self.frames.get(timeout=0.5, accept=self._is_fresh)
+            if frame is None:
+                continue
+            try:
+                with self._detecting:
+                    results = self.detect(frame)
+            except Exception as e:
+                self.logger.error(f"流水線檢測出錯: {str(e)}")
+                continue
+            finally:
+                # 動作階段只需要時間戳，檢測完就歸還緩衝區
+                frame.release()
+            self.stats.detected += 1
+            try:
+                self.detections.put((frame, results), timeout=0.5)
+            except queue.Full:
+                continue
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.detections.qsize())
+
+    @contextmanager
+    def paused(self):
+        """在 with 區塊內暫停檢測階段 (等進行中的檢測完成)，擷取階段照常執行；
+        動作處理中的 wait_for 等檢測與狀態圖、搜尋區域等共用狀態不會和檢測執行緒同時執行"""
+        with self._detecting:
+            yield
+
+    def _is_fresh(self, frame):
+        return frame.timestamp >= self.last_input()
+
+    def latest_frame(self, timeout=1.0):
+        """取得最後一次按鍵之後擷取的最新畫面 (給動作階段內的流程使用)，用完要 release()"""
+        return self.frames.peek(timeout, accept=self._is_fresh)
+
+    def next_detection(self, timeout=0.5):
+        """取出下一個檢測結果，最後一次按鍵之前擷取的畫面結果視為過期並丟棄"""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                frame, results = self.detections.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if not self._is_fresh(frame):
+                self.stats.stale_dropped += 1
+                continue
+            return frame, results
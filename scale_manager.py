@@ -0,0 +1,177 @@
+import math
+import time
+import logging
+import threading
+import cv2
+from detector import MATCH_METHODS, parse_methods, score_match
+
+# 尋找比例時先在縮小的畫面上定位，縮小後的模板邊長至少 MIN_COARSE_SIZE 像素
+SEARCH_FACTOR = 2
+MIN_COARSE_SIZE = 8
+
+
+class ScaleManager:
+    def __init__(self, registry, candidates=(1.0,), base_height=1080, min_score=0.9,
+                 retry_interval=2.0, thresholds=None, methods=None, default_methods=None,
+                 threshold_margin=0.005, max_matches=8, views=None): #介面縮放比例
+        """模板以 base_height 的畫面截取，只使用 candidates (template_scales) 中的比例；
+        第一次有模板在某個比例下達到接近它檢測閾值的分數 (閾值減 threshold_margin，不低於 min_score) 時
+        鎖定該比例，之後所有模板一次縮放並快取，只有視窗大小改變時才重新尋找。
+        每次尋找最多比對 max_matches 組 (比例, 模板)，下次從停下的位置繼續；
+        views 為取得縮放模板組的函數 (多視窗共用)，預設由 registry.at_scale 建立"""
+        self.logger = logging.getLogger(__name__)
+        self.base = registry
+        self.registry = registry
+        self.candidates = tuple(sorted({round(float(scale), 4) for scale in candidates})) or (1.0,)
+        self.base_height = base_height
+        self.min_score = min_score
+        self.retry_interval = retry_interval
+        self.thresholds = thresholds or {}
+        self.methods = methods or {}
+        self.default_methods = default_methods or MATCH_METHODS
+        self.threshold_margin = threshold_margin
+        self.max_matches = max_matches
+        self.active = 1.0
+        self.scale = None
+        self.window_size = None
+        self.views = views or registry.at_scale
+        self._views = {}
+        self._next_discovery = 0.0
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self.discoveries = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_config(cls, config, registry, views=None):
+        """從配置字典建立，未啟用時返回 None"""
+        options = config.get('scale', {})
+        if not options.get('enabled', False):
+            return None
+        default_method = config.get('detection', {}).get('default_method')
+        return cls(registry,
+                   candidates=config.get('template_scales', [1.0]),
+                   base_height=options.get('base_height', 1080),
+                   min_score=options.get('min_score', 0.9),
+                   retry_interval=options.get('retry_interval', 2.0),
+                   thresholds=config.get('thresholds', {}),
+                   methods={key: parse_methods(name) for key, name in config.get('methods', {}).items()},
+                   default_methods=parse_methods(default_method) if default_method else None,
+                   threshold_margin=options.get('threshold_margin', 0.005),
+                   max_matches=options.get('max_matches', 8),
+                   views=views)
+
+    @property
+    def locked(self):
+        return self.scale is not None
+
+    def guess(self, frame_height):
+        """依畫面高度推算的縮放比例"""
+        return round(frame_height / self.base_height, 4)
+
+    def ordered(self, frame_height):
+        """要嘗試的縮放比例 (只有設定的比例)，越接近推算值的越先嘗試"""
+        guess = self.guess(frame_height)
+        return sorted(self.candidates, key=lambda scale: abs(math.log(scale / guess)))
+
+    def _view(self, scale):
+        view = self._views.get(scale)
+        if view is None:
+            view = self._views[scale] = self.views(scale)
+        return view
+
+    def _activate(self, scale):
+        """切換使用中的模板組，返回座標需要乘上的倍數 (沒有改變時返回 None)"""
+        if scale == self.active:
+            return None
+        factor = scale / self.active
+        self.active = scale
+        self.registry = self._view(scale)
+        return factor
+
+    def update(self, frame, keys, window_size=None):
+        """每次檢測前呼叫；window_size 為 GetWindowRect 的 (寬, 高)，沒有視窗時使用畫面大小
+        返回使用中的比例改變的倍數，None 表示沒有改變"""
+        if window_size is None:
+            window_size = (frame.shape[1], frame.shape[0])
+        with self._lock:
+            if window_size != self.window_size:
+                if self.window_size is not None:
+                    self.logger.info(f"視窗大小改變 {self.window_size} → {window_size}，重新尋找縮放比例")
+                    self.invalidations += 1
+                self.window_size = window_size
+                self.scale = None
+                self._views.clear()
+                self._next_discovery = 0.0
+                self._cursor = 0
+                # 找到比例之前先使用最接近推算值的設定比例
+                factor = self._activate(self.ordered(frame.shape[0])[0])
+                return self._combine(factor, self._discover(frame, keys))
+            if self.scale is None:
+                return self._discover(frame, keys)
+        return None
+
+    @staticmethod
+    def _combine(first, second):
+        if first is None or second is None:
+            return first or second
+        return first * second
+
+    def required_score(self, key):
+        """鎖定比例需要的分數：接近該模板的檢測閾值，不低於 min_score"""
+        return max(self.min_score, self.thresholds.get(key, self.min_score) - self.threshold_margin)
+
+    def locate(self, frame, template, scale):
+        """模板以 scale 縮放後在灰階畫面上的最佳位置：先在縮小 SEARCH_FACTOR 倍的畫面上找，
+        再在原解析度的鄰近區域確認；模板太小無法縮小時直接在整個畫面上找"""
+        gray = template.scaled(scale)[1]
+        coarse = template.scaled(scale / SEARCH_FACTOR)[1]
+        image = frame.downscaled(SEARCH_FACTOR, gray=True)
+        if min(coarse.shape) < MIN_COARSE_SIZE or coarse.shape[0] > image.shape[0] or coarse.shape[1] > image.shape[1]:
+            return cv2.minMaxLoc(cv2.matchTemplate(frame.gray, gray, cv2.TM_CCOEFF_NORMED))[3]
+        x, y = cv2.minMaxLoc(cv2.matchTemplate(image, coarse, cv2.TM_CCOEFF_NORMED))[3]
+        margin = SEARCH_FACTOR * 2
+        left, top = max(0, x * SEARCH_FACTOR - margin), max(0, y * SEARCH_FACTOR - margin)
+        patch = frame.gray[top:y * SEARCH_FACTOR + gray.shape[0] + margin, left:x * SEARCH_FACTOR + gray.shape[1] + margin]
+        if patch.shape[0] < gray.shape[0] or patch.shape[1] < gray.shape[1]:
+            return cv2.minMaxLoc(cv2.matchTemplate(frame.gray, gray, cv2.TM_CCOEFF_NORMED))[3]
+        x, y = cv2.minMaxLoc(cv2.matchTemplate(patch, gray, cv2.TM_CCOEFF_NORMED))[3]
+        return x + left, y + top
+
+    def score(self, frame, key, scale):
+        """模板以 scale 縮放後在畫面上的分數：灰階找出位置後以檢測使用的方法做彩色確認"""
+        template = self.base.get(key)
+        color = template.scaled(scale)[0]
+        if color.shape[0] > frame.shape[0] or color.shape[1] > frame.shape[1]:
+            return -1.0
+        x, y = self.locate(frame, template, scale)
+        patch = frame.image[y:y + color.shape[0], x:x + color.shape[1]]
+        return max(score_match(patch, color, method)[0] for method in self.methods.get(key, self.default_methods))
+
+    def _discover(self, frame, keys):
+        """依比例接近推算值的順序比對 (比例, 模板)，第一個達到 required_score 的比例就鎖定"""
+        now = time.monotonic()
+        if now < self._next_discovery:
+            return None
+        self._next_discovery = now + self.retry_interval
+        pairs = [(scale, key) for scale in self.ordered(frame.shape[0])
+                 for key in keys if self.base.get(key) is not None]
+        if not pairs:
+            return None
+        # 每次只比對一部分，避免每次重試都在整張畫面上比對所有模板與比例
+        start = self._cursor % len(pairs)
+        batch = (pairs[start:] + pairs[:start])[:self.max_matches]
+        self._cursor = start + len(batch)
+        for scale, key in batch:
+            score = self.score(frame, key, scale)
+            if score >= self.required_score(key):
+                self.scale = scale
+                self.discoveries += 1
+                self.logger.info(f"鎖定介面縮放比例 {scale:g} ({key} 分數 {score:.3f})")
+                return self._activate(scale)
+        return None
+
+    def stats(self):
+        """返回目前比例與重新尋找的次數"""
+        return {'scale': self.scale, 'active': self.active, 'window_size': self.window_size,
+                'discoveries': self.discoveries, 'invalidations': self.invalidations}
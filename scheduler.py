@@ -0,0 +1,91 @@
+import time
+import logging
+import threading
+
+
+class PollScheduler:
+    def __init__(self, min_interval=0.05, base_interval=0.5, max_interval=4.0, backoff=1.5,
+                 boost=2.0, cpu_budget=None, cpu_window=5.0, phases=None): #輪詢間隔排程
+        """按鍵之後 boost 秒內以 min_interval 快速輪詢，之後每次沒有變化就把間隔乘以 backoff，
+        最長 max_interval；cpu_budget 是整個程式可使用的單核心 CPU 百分比 (快速輪詢期間不限制)"""
+        self.logger = logging.getLogger(__name__)
+        self.defaults = {'min_interval': min_interval, 'base_interval': base_interval,
+                         'max_interval': max_interval, 'backoff': backoff}
+        self.phases = phases or {}
+        self.boost = boost
+        self.cpu_budget = cpu_budget
+        self.cpu_window = cpu_window
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._boost_until = 0.0
+        # CPU 用量的統計起點，第一次輪詢時才開始計算 (不包含啟動時載入模板的用量)
+        self._window_start = None
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立"""
+        options = config.get('scheduler', {})
+        return cls(min_interval=options.get('min_interval', 0.05),
+                   base_interval=options.get('base_interval', 0.5),
+                   max_interval=options.get('max_interval', 4.0),
+                   backoff=options.get('backoff', 1.5),
+                   boost=options.get('boost', 2.0),
+                   cpu_budget=options.get('cpu_budget'),
+                   cpu_window=options.get('cpu_window', 5.0),
+                   phases=options.get('phases'))
+
+    def option(self, phase, name):
+        return self.phases.get(phase, {}).get(name, self.defaults[name])
+
+    def on_input(self):
+        """按鍵之後畫面即將改變，所有階段恢復快速輪詢"""
+        self.expect_transition(self.boost)
+
+    def expect_transition(self, seconds):
+        """預期畫面會在 seconds 秒內改變時呼叫，這段時間以最短間隔輪詢"""
+        with self._lock:
+            self._boost_until = max(self._boost_until, time.monotonic() + seconds)
+            self._idle.clear()
+
+    def next_interval(self, phase="main"):
+        """返回這次輪詢前要等待的秒數，並累計此階段沒有變化的次數"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._boost_until:
+                # 按鍵後的快速輪詢不受 CPU 預算限制，這段期間的用量也不計入預算
+                self._window_start = None
+                return self.option(phase, 'min_interval')
+            idle = self._idle.get(phase, 0)
+            self._idle[phase] = idle + 1
+            interval = min(self.option(phase, 'base_interval') * self.option(phase, 'backoff') ** idle,
+                           self.option(phase, 'max_interval'))
+        return max(interval, self._cpu_throttle(now, interval))
+
+    def _cpu_throttle(self, now, interval):
+        """超過 CPU 預算時返回需要的等待時間，讓這段期間的平均使用率回到預算以內"""
+        if not self.cpu_budget:
+            return 0.0
+        if self._window_start is None:
+            self._window_start = (now, time.process_time())
+        start_wall, start_cpu = self._window_start
+        elapsed = now - start_wall
+        used = time.process_time() - start_cpu
+        if elapsed >= self.cpu_window:
+            self._window_start = (now, time.process_time())
+        # 單次最多延長一個統計週期，避免長時間無回應
+        required = min(used * 100.0 / self.cpu_budget - elapsed, self.cpu_window)
+        if required <= interval:
+            return 0.0
+        self.throttled += 1
+        self.throttled_seconds += required - interval
+        if self.throttled % 20 == 1:
+            self.logger.info(f"CPU 使用率 {used / max(elapsed, 1e-6):.0%} 超過預算 {self.cpu_budget}%，"
+                             f"延長等待至 {required:.2f} 秒")
+        return required
+
+    def stats(self):
+        """返回各階段目前的閒置次數與 CPU 節流統計"""
+        return {'idle': dict(self._idle), 'throttled': self.throttled,
+                'throttled_seconds': round(self.throttled_seconds, 2)}
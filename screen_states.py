@@ -0,0 +1,83 @@
+import time
+import logging
+
+
+class ScreenStateGraph:
+    def __init__(self, states, initial, timeout=10.0, priority=None): #畫面狀態圖
+        """states: {狀態: {模板: {"action": 操作名稱, "next": 下一個狀態}}}
+        每個狀態只列出接下來可能出現的模板，檢測時只比對這些模板"""
+        self.logger = logging.getLogger(__name__)
+        self.states = states
+        self.initial = initial
+        self.timeout = timeout
+        self.priority = priority or []
+        self.current = initial
+        self.changed = time.time()
+        self.full_scans = 0
+        self.scans = 0
+        for state, candidates in states.items():
+            for key, spec in candidates.items():
+                if spec.get('next', state) not in states:
+                    raise ValueError(f"狀態 {state} 的 {key} 指向未定義的狀態 {spec['next']}")
+        if initial not in states:
+            raise ValueError(f"未定義的初始狀態: {initial}")
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立，未啟用時返回 None"""
+        graph = config.get('screen_states', {})
+        if not graph.get('enabled', False):
+            return None
+        return cls(graph['states'], graph['initial'],
+                   timeout=graph.get('timeout', 10.0),
+                   priority=config.get('priority'))
+
+    def _ordered(self, keys):
+        """按 priority 排序，未列在 priority 中的模板排在最後"""
+        order = {key: i for i, key in enumerate(self.priority)}
+        return sorted(keys, key=lambda key: order.get(key, len(order)))
+
+    def candidates(self):
+        """返回目前狀態要比對的模板；停留超過 timeout 時返回 None，表示這次掃描全部模板"""
+        self.scans += 1
+        if time.time() - self.changed > self.timeout:
+            # 每個 timeout 週期只做一次全畫面掃描，避免狀態判斷錯誤時卡住
+            self.logger.info(f"狀態 {self.current} 超過 {self.timeout:g} 秒沒有變化，檢測全部模板")
+            self.changed = time.time()
+            self.full_scans += 1
+            return None
+        return self._ordered(self.states[self.current])
+
+    def action_for(self, key):
+        """返回命中 key 時要執行的操作，不在目前狀態中時從其他狀態尋找 (全部掃描時)"""
+        spec = self._spec(key)
+        return spec.get('action') if spec is not None else None
+
+    def _spec(self, key):
+        if key in self.states[self.current]:
+            return self.states[self.current][key]
+        for candidates in self.states.values():
+            if key in candidates:
+                return candidates[key]
+        return None
+
+    def advance(self, key):
+        """執行 key 的操作後轉移到下一個狀態"""
+        if key in self.states[self.current]:
+            target = self.states[self.current][key].get('next', self.current)
+        else:
+            # 全部掃描時命中其他狀態的模板，重新同步到定義它的狀態
+            target = next((candidates[key].get('next', state) for state, candidates in self.states.items()
+                           if key in candidates), self.current)
+        if target != self.current:
+            self.logger.info(f"畫面狀態: {self.current} → {target}")
+            self.current = target
+        self.changed = time.time()
+
+    def reset(self):
+        self.current = self.initial
+        self.changed = time.time()
+
+    def stats(self):
+        """返回目前狀態與全部掃描的次數"""
+        return {'state': self.current, 'scans': self.scans, 'full_scans': self.full_scans}
@@ -0,0 +1,114 @@
+import os
+import json
+import logging
+from collections import deque
+from pathlib import Path
+
+
+class SearchRegions:
+    def __init__(self, regions=None, learn=False, padding=32, max_misses=5, history=20, path=None): #模板搜尋區域
+        # path 為學習到的搜尋區域檔案：啟動時載入 (config.json 設定的區域優先)，結束時以 save() 寫回
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path) if path else None
+        self.regions = {key: tuple(rect) for key, rect in self.load().items()}
+        self.regions.update({key: tuple(rect) for key, rect in (regions or {}).items()})
+        self.learn = learn
+        self.padding = padding
+        self.max_misses = max_misses
+        self.history = {}
+        self.misses = {}
+        self.size = history
+
+    @classmethod
+    def from_config(cls, config, persist=True):
+        """從配置字典建立搜尋區域，persist 為 False 時不讀寫學習到的搜尋區域檔案 (例如測量基準)"""
+        learning = config.get('roi_learning', {})
+        return cls(config.get('search_regions', {}),
+                   learn=learning.get('enabled', False),
+                   padding=learning.get('padding', 32),
+                   max_misses=learning.get('max_misses', 5),
+                   history=learning.get('history', 20),
+                   path=learning.get('path') if persist and learning.get('enabled', False) else None)
+
+    def load(self):
+        """讀取上次執行學習到的搜尋區域 (以 1.0 縮放比例的座標保存)，檔案不存在或無法讀取時返回空字典"""
+        if self.path is None or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                regions = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"無法讀取搜尋區域檔案 {self.path}: {e}")
+            return {}
+        self.logger.info(f"已載入 {len(regions)} 個學習到的搜尋區域")
+        return regions
+
+    def has_region(self, key):
+        """是否已為此模板設定或學習到搜尋區域"""
+        return key in self.regions
+
+    def region_for(self, key, frame_shape):
+        """返回 (x, y, w, h) 搜尋區域，None 表示搜尋整個畫面"""
+        rect = self.regions.get(key)
+        if rect is None:
+            return None
+
+        # 連續未命中達到上限時，搜尋一次全畫面
+        if self.misses.get(key, 0) >= self.max_misses:
+            self.misses[key] = 0
+            return None
+
+        frame_h, frame_w = frame_shape[:2]
+        x, y, w, h = rect
+        x, y = max(0, x), max(0, y)
+        w, h = min(w, frame_w - x), min(h, frame_h - y)
+        if w <= 0 or h <= 0:
+            return None
+        return x, y, w, h
+
+    def record(self, key, found, loc=None, size=None, region=None):
+        """記錄匹配結果，學習模式下根據歷史命中位置更新搜尋區域"""
+        if not found:
+            if region is not None:
+                self.misses[key] = self.misses.get(key, 0) + 1
+            return
+
+        self.misses[key] = 0
+        if not self.learn or loc is None or size is None:
+            return
+
+        locations = self.history.setdefault(key, deque(maxlen=self.size))
+        locations.append(loc)
+
+        w, h = size
+        left = min(x for x, _ in locations) - self.padding
+        top = min(y for _, y in locations) - self.padding
+        right = max(x for x, _ in locations) + w + self.padding
+        bottom = max(y for _, y in locations) + h + self.padding
+        rect = (max(0, left), max(0, top), right - max(0, left), bottom - max(0, top))
+
+        if self.regions.get(key) != rect:
+            self.logger.info(f"更新搜尋區域 {key}: {rect}")
+            self.regions[key] = rect
+
+    def rescale(self, factor):
+        """畫面縮放比例改變時，把搜尋區域換算到新的座標並清除學習紀錄"""
+        self.regions = {key: tuple(int(round(value * factor)) for value in rect)
+                        for key, rect in self.regions.items()}
+        self.history.clear()
+        self.misses.clear()
+
+    def export(self, scale=1.0):
+        """返回可寫回 config.json 的搜尋區域，座標換算回 1.0 縮放比例 (scale 為目前使用中的比例)"""
+        return {key: [int(round(value / scale)) for value in rect] for key, rect in self.regions.items()}
+
+    def save(self, scale=1.0):
+        """把搜尋區域寫入 path，下次啟動時不必重新學習"""
+        if self.path is None or not self.regions:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.export(scale), f, indent=4, ensure_ascii=False)
+        os.replace(temp, self.path)
+        self.logger.info(f"已保存 {len(self.regions)} 個搜尋區域至 {self.path}")
@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+from template_registry import Template, TemplateRegistry
+
+# 模板包：<path>.<雜湊>.bin 是所有模板陣列 (uint8) 依序排列的原始資料，<path>.json 是索引
+# 啟動時只需讀取索引並 memmap 資料檔，多個程序共用同一份頁面快取；
+# 資料檔以內容雜湊命名且寫入後不再修改，重新建立時已對應記憶體的程序繼續使用舊檔
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def bundle_scales(config):
+    """模板包收錄的縮放比例：template_scales 與金字塔模式的粗略比例"""
+    scales = {round(float(scale), 4) for scale in config.get('template_scales', [1.0])} | {1.0}
+    factor = config.get('detection', {}).get('pyramid_factor', 2)
+    if factor > 1:
+        scales.add(round(1.0 / factor, 4))
+    return sorted(scales)
+
+
+def configured_scales(scales):
+    """config.json template_scales 正規化後的列表，記錄在索引中判斷模板包是否過期"""
+    return sorted({round(float(scale), 4) for scale in scales})
+
+
+def content_hash(sources, scales):
+    """模板內容與縮放比例的雜湊，任何模板圖片改變時都會不同"""
+    payload = {'version': FORMAT_VERSION, 'scales': scales,
+               'sources': {key: [source['path'], source['sha256']] for key, source in sorted(sources.items())}}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def build_bundle(config, path=None):
+    """讀取 config.json 列出的所有模板圖片，寫出 <path>.bin 與 <path>.json，返回索引"""
+    path = Path(path or config.get('template_bundle', {}).get('path', 'templates.bundle'))
+    scales = bundle_scales(config)
+    registry = TemplateRegistry(config['image_paths'], scales)
+
+    arrays = []
+    offset = 0
+    templates = {}
+    for key, template in registry.templates.items():
+        stat = Path(template.path).stat()
+        variants = {}
+        for scale in scales:
+            variant = {}
+            for name, array in zip(('color', 'gray'), template.scaled(scale)):
+                array = np.ascontiguousarray(array, dtype=np.uint8)
+                mean, norm = template.stats(scale, gray=(name == 'gray'))
+                variant[name] = {'offset': offset, 'shape': list(array.shape), 'mean': list(mean), 'norm': norm}
+                arrays.append((offset, array))
+                offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+            variants[f"{scale:g}"] = variant
+        templates[key] = {'path': template.path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                          'sha256': file_digest(template.path), 'scales': variants}
+
+    digest = content_hash(templates, scales)
+    data_path, index_path = path.with_name(f"{path.name}.{digest[:16]}.bin"), path.with_name(path.name + '.json')
+    index = {
+        'version': FORMAT_VERSION,
+        'hash': digest,
+        'scales': scales,
+        'template_scales': configured_scales(config.get('template_scales', [1.0])),
+        'data': data_path.name,
+        'bytes': offset,
+        'templates': templates,
+    }
+
+    # 資料檔與索引都先寫入暫存檔再替換，讀取端不會看到只寫了一半的模板包；
+    # 相同內容的資料檔已存在時 (可能正被其他程序對應) 不重寫
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not data_path.exists():
+        temp = data_path.with_name(f"{data_path.name}.{os.getpid()}.tmp")
+        with open(temp, 'wb') as f:
+            for array_offset, array in arrays:
+                f.seek(array_offset)
+                f.write(array.tobytes())
+            f.truncate(offset)
+        os.replace(temp, data_path)
+    temp = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(temp, index_path)
+    remove_old_data(path, data_path)
+    logger.info(f"已建立模板包 {data_path} ({len(templates)} 個模板, {len(scales)} 種縮放, "
+                f"{offset / 2**20:.1f} MB, 雜湊 {index['hash'][:12]})")
+    return index
+
+
+def remove_old_data(path, keep):
+    """刪除舊版本的資料檔，仍被其他程序對應 (Windows 無法刪除) 的留待下次建立時再刪"""
+    for old in path.parent.glob(f"{path.name}.*.bin"):
+        if old.name == keep.name:
+            continue
+        try:
+            old.unlink()
+        except OSError:
+            logger.info(f"舊的模板包資料檔仍在使用中，稍後再刪除: {old}")
+
+
+class TemplateBundle:
+    def __init__(self, path): #唯讀對應記憶體的模板包
+        path = Path(path)
+        with open(path.with_name(path.name + '.json'), 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        if self.index.get('version') != FORMAT_VERSION:
+            raise ValueError(f"模板包版本不符: {self.index.get('version')}")
+        self.hash = self.index['hash']
+        self.data = np.memmap(path.with_name(self.index['data']), dtype=np.uint8, mode='r')
+
+    def array(self, record):
+        size = int(np.prod(record['shape']))
+        return self.data[record['offset']:record['offset'] + size].reshape(record['shape'])
+
+    def stale(self, image_paths, scales=(1.0,)):
+        """返回模板包與目前模板圖片、template_scales 不一致的原因，一致時返回空列表
+        先比對檔案大小與修改時間，不同時再比對內容雜湊 (例如重新 checkout 後)"""
+        reasons = []
+        if configured_scales(scales) != self.index['template_scales']:
+            reasons.append(f"template_scales 已改變 (模板包: {self.index['template_scales']})")
+        templates = self.index['templates']
+        for key, path in image_paths.items():
+            entry = templates.get(key)
+            if entry is None or entry['path'] != path:
+                reasons.append(f"{key}: 不在模板包中")
+                continue
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                # 圖片不存在時沿用模板包中的版本
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']) \
+                    and file_digest(path) != entry['sha256']:
+                reasons.append(f"{key}: 圖片已改變")
+        return reasons
+
+    def registry(self, image_paths, scales=(1.0,)):
+        """建立使用模板包陣列的註冊表"""
+        registry = TemplateRegistry(scales=scales)
+        registry.content_hash = self.hash
+        for key in image_paths:
+            entry = self.index['templates'][key]
+            variants = {round(float(scale), 4): variant for scale, variant in entry['scales'].items()}
+            base = variants[1.0]
+            template = Template(key, entry['path'], self.array(base['color']), scales=(),
+                                gray=self.array(base['gray']))
+            for scale, variant in variants.items():
+                template._scaled[scale] = (self.array(variant['color']), self.array(variant['gray']))
+                template._stats[(scale, False)] = (tuple(variant['color']['mean']), variant['color']['norm'])
+                template._stats[(scale, True)] = (tuple(variant['gray']['mean']), variant['gray']['norm'])
+            registry.templates[key] = template
+        return registry
+
+
+def load_registry(path, image_paths, scales=(1.0,)):
+    """從模板包建立註冊表，模板包不存在或已過期時返回 None (改為讀取圖片)"""
+    try:
+        bundle = TemplateBundle(path)
+    except FileNotFoundError:
+        logger.info(f"未找到模板包 {path}，改為讀取模板圖片 (可執行 python template_bundle.py 建立)")
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"無法讀取模板包 {path}: {e}")
+        return None
+    reasons = bundle.stale(image_paths, scales)
+    if reasons:
+        logger.warning(f"模板包已過期，改為讀取模板圖片: {'; '.join(reasons[:3])}")
+        return None
+    registry = bundle.registry(image_paths, scales)
+    logger.info(f"已從模板包載入 {len(registry.templates)} 個模板 (雜湊 {bundle.hash[:12]})")
+    return registry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把 config.json 列出的模板圖片編譯成可 memmap 的模板包")
+    parser.add_argument("--config", default="config.json", help="配置文件路徑")
+    parser.add_argument("--output", help="模板包路徑 (不含副檔名)，預設使用 template_bundle.path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    index = build_bundle(config, args.output)
+    print(f"{len(index['templates'])} 個模板, 雜湊 {index['hash']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import logging
+import cv2
+import numpy as np
+
+
+def template_stats(image):
+    """TM_CCOEFF_NORMED 使用的 (各通道平均值, 減去平均值後的平方和)"""
+    planes = image.reshape(-1, image.shape[2] if image.ndim == 3 else 1).astype(np.float64)
+    mean = planes.mean(axis=0)
+    return tuple(mean.tolist()), float(((planes - mean) ** 2).sum())
+
+
+class Template:
+    def __init__(self, key, path, image, scales=(1.0,), gray=None): #單一模板
+        self.key = key
+        self.path = path
+        self.color = image
+        self.gray = gray if gray is not None else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.height, self.width = image.shape[:2]
+        self._scaled = {1.0: (self.color, self.gray)}
+        self._stats = {}
+        for scale in scales:
+            self.scaled(scale)
+
+    def scaled(self, scale):
+        """取得指定縮放比例的 (彩色, 灰階) 模板，結果會快取"""
+        scale = round(float(scale), 4)
+        if scale not in self._scaled:
+            width = max(1, int(round(self.width * scale)))
+            height = max(1, int(round(self.height * scale)))
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            color = cv2.resize(self.color, (width, height), interpolation=interpolation)
+            gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+            self._scaled[scale] = (color, gray)
+        return self._scaled[scale]
+
+    def stats(self, scale=1.0, gray=False):
+        """指定縮放比例的 (各通道平均值, 平方和)，模板包中已預先計算，否則第一次使用時計算並快取"""
+        scale = round(float(scale), 4)
+        if (scale, gray) not in self._stats:
+            self._stats[(scale, gray)] = template_stats(self.scaled(scale)[1 if gray else 0])
+        return self._stats[(scale, gray)]
+
+
+class TemplateRegistry:
+    def __init__(self, image_paths=None, scales=(1.0,)): #模板註冊表
+        self.logger = logging.getLogger(__name__)
+        self.scales = tuple(scales)
+        self.templates = {}
+        # 從模板包載入時為模板包的內容雜湊
+        self.content_hash = None
+        if image_paths:
+            self.load(image_paths)
+
+    @classmethod
+    def from_config(cls, config):
+        """從配置字典建立註冊表，模板包啟用且與模板圖片一致時直接對應記憶體，不必解碼 PNG"""
+        scales = config.get('template_scales', [1.0])
+        bundle = config.get('template_bundle', {})
+        if bundle.get('enabled', False):
+            from template_bundle import load_registry
+            registry = load_registry(bundle.get('path', 'templates.bundle'), config['image_paths'], scales)
+            if registry is not None:
+                return registry
+        return cls(config['image_paths'], scales)
+
+    def load(self, image_paths):
+        """啟動時一次性讀取所有模板圖片"""
+        for key, path in image_paths.items():
+            if not os.path.exists(path):
+                self.logger.error(f"圖片不存在: {path}")
+                continue
+            image = cv2.imread(path)
+            if image is None:
+                self.logger.error(f"無法讀取模板圖片: {path}")
+                continue
+            self.templates[key] = Template(key, path, image, self.scales)
+        self.logger.info(f"已載入 {len(self.templates)} 個模板")
+
+    def at_scale(self, scale):
+        """返回所有模板都縮放到 scale 的新註冊表 (使用各模板快取的縮放結果)"""
+        scale = round(float(scale), 4)
+        if scale == 1.0:
+            return self
+        registry = TemplateRegistry()
+        for key, template in self.templates.items():
+            color, gray = template.scaled(scale)
+            registry.templates[key] = Template(key, template.path, color, scales=(), gray=gray)
+        return registry
+
+    def get(self, key):
+        """取得模板，不存在時返回 None"""
+        return self.templates.get(key)
+
+    def __contains__(self, key):
+        return key in self.templates
+
+    def keys(self):
+        return self.templates.keys()
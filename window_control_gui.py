@@ -5,7 +5,6 @@ import win32con
 import time
 import keyboard
 import threading
-from game_loop import GameLoop
 
 class WindowControlGUI:
     def __init__(self, root):
@@ -112,6 +111,8 @@ class WindowControlGUI:
         self.topmost_var.set(True)
         
         # 創建並啟動GameLoop
+        # 第一次啟動時才匯入 (cv2、numpy 等模組)，讓介面立即顯示
+        from game_loop import GameLoop
         self.game_loop = GameLoop()
         self.is_running = True
         self.domination_thread = threading.Thread(target=self.game_loop.start)